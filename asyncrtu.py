@@ -0,0 +1,372 @@
+import asyncio
+import os
+from collections import deque
+
+from circuitbreaker import CircuitBreaker
+from rtucodec import (
+    MAX_FRAME,
+    FrameEncoder,
+    ModbusError,
+    check_response,
+    decode_bits,
+    decode_registers,
+    response_length,
+)
+
+# Waktu proses slave (antara request selesai dikirim dan respons mulai)
+# dipelajari dari pengukuran. Slave yang belum pernah menjawab diberi budget
+# lebar yang lalu menyempit mengikuti sampel, bukan budget sempit yang baru
+# melebar setelah gagal (respons yang telat bisa tertukar dengan transaksi
+# berikutnya).
+PROBE_TURNAROUND = 1.0
+MIN_TURNAROUND = 0.005
+MAX_TURNAROUND = 1.0
+LATENCY_WINDOW = 32
+LATENCY_PERCENTILE = 0.95
+LATENCY_MARGIN = 2.0
+MIN_SAMPLES = 3
+
+
+def char_time(baudrate, bytesize=8, parity="N", stopbits=1):
+    """Lama satu karakter di kabel: start + data + parity + stop bit"""
+    bits = 1 + bytesize + (0 if parity == "N" else 1) + stopbits
+    return bits / baudrate
+
+
+class AsyncRTUClient:
+    """
+    Client Modbus RTU berbasis asyncio untuk satu port serial.
+
+    Satu transport per port: file descriptor serial didaftarkan ke event loop
+    (add_reader), lalu panjang frame respons dihitung dari request sehingga
+    transaksi selesai begitu byte terakhir masuk, tanpa menunggu timeout.
+    Pemanggil wajib memegang lock port dari BusArbiter, karena hanya boleh
+    ada satu transaksi aktif per port.
+
+    Tiap slave dijaga circuit breaker: slave yang mati ditolak langsung
+    (CircuitOpenError) tanpa menunggu timeout dan tanpa memakai bus.
+    Kalau port serial error (adapter terlepas), port dibuka ulang lewat
+    callback reopen dari PortManager sebelum transaksi berikutnya.
+    """
+
+    def __init__(self, ser, breaker=None, reopen=None):
+        self.ser = ser
+        self.port = ser.port
+        self.reopen = reopen
+        self._faulted = False
+        # Parameter CircuitBreaker (threshold, backoff, max_backoff)
+        self.breaker_params = breaker or {}
+        self.breakers = {}
+
+        # Jeda antar frame minimal 3.5 karakter (t3.5), 1.75 ms di atas 19200
+        self.char_time = char_time(ser.baudrate, ser.bytesize, ser.parity, ser.stopbits)
+        self.silent_interval = max(3.5 * self.char_time, 0.00175)
+
+        # Sampel waktu proses per slave
+        self.latencies = {}
+        # Setelah timeout port didiamkan sampai respons telat selesai masuk
+        # (atau batas turnaround slave lewat) sebelum request berikutnya
+        self._late = None
+        self._quiet_until = 0.0
+        self._quiet_waiter = None
+
+        # Buffer request & respons dialokasikan sekali per port
+        self._encoder = FrameEncoder()
+        self._rx = bytearray(MAX_FRAME)
+        self._rx_view = memoryview(self._rx)
+        self._rx_len = 0
+        # Penampung byte buangan saat buffer respons sudah penuh
+        self._drop_view = memoryview(bytearray(MAX_FRAME))
+
+        self._fd = None
+        self._expected = 0
+        self._waiter = None
+        self._last_io = 0.0
+
+    def open(self):
+        """Daftarkan port ke event loop yang sedang berjalan"""
+        self._fd = self.ser.fileno()
+        asyncio.get_running_loop().add_reader(self._fd, self._on_readable)
+
+    def close(self):
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            self._fd = None
+
+    def _fault(self):
+        # Lepas fd dari event loop supaya callback tidak berputar terus
+        self._faulted = True
+        self.close()
+
+    def _reattach(self):
+        if self.reopen is None:
+            raise IOError(f"Port {self.port} error dan tidak bisa dibuka ulang")
+        try:
+            self.ser = self.reopen(self.port)
+        except (OSError, ValueError) as e:
+            raise IOError(f"Gagal membuka ulang {self.port}: {e}")
+        self._faulted = False
+        self.open()
+
+    def _on_readable(self):
+        # Byte di luar transaksi (sisa respons yang telat) dibuang, tapi
+        # waktunya dicatat supaya timeout slave itu ikut melebar
+        if self._waiter is None or self._waiter.done():
+            try:
+                data = os.read(self._fd, MAX_FRAME)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                self._fault()
+                return
+            if not data:
+                self._fault()
+                return
+            now = asyncio.get_running_loop().time()
+            if self._late is not None:
+                slave, sent_at = self._late
+                self._late = None
+                self._record_latency(slave, now - sent_at)
+            # Respons telat sudah datang: cukup jeda t3.5 dari byte terakhir
+            self._last_io = now
+            self._quiet_until = 0.0
+            if self._quiet_waiter is not None and not self._quiet_waiter.done():
+                self._quiet_waiter.set_result(None)
+            return
+
+        # Baca langsung ke buffer respons, tanpa objek bytes perantara.
+        # Buffer penuh tapi frame belum lengkap (noise, baudrate salah):
+        # byte berikutnya dibuang sampai transaksi timeout, port tidak
+        # dianggap putus. readv tidak pernah diberi buffer kosong, jadi 0
+        # byte selalu berarti EOF.
+        full = self._rx_len >= MAX_FRAME
+        target = self._drop_view if full else self._rx_view[self._rx_len :]
+        try:
+            count = os.readv(self._fd, [target])
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._fault()
+            self._waiter.set_exception(e)
+            return
+        if count == 0:
+            self._fault()
+            self._waiter.set_exception(IOError("EOF, port terputus"))
+            return
+        if full:
+            return
+        self._rx_len += count
+
+        # Exception response selalu 5 byte: slave, fc|0x80, code, crc(2)
+        if self._rx_len >= 2 and self._rx[1] & 0x80:
+            self._expected = 5
+        if self._rx_len >= self._expected:
+            self._waiter.set_result(self._rx_view[: self._expected])
+
+    def breaker(self, slave):
+        breaker = self.breakers.get(slave)
+        if breaker is None:
+            breaker = self.breakers[slave] = CircuitBreaker(
+                f"{self.port}_{slave}", **self.breaker_params
+            )
+        return breaker
+
+    async def _transact(
+        self, slave, request, expected_len, turnaround=None, deadline=None
+    ):
+        breaker = self.breaker(slave)
+        breaker.check()
+        try:
+            response = await self._exchange(
+                slave, request, expected_len, turnaround, deadline
+            )
+        except ModbusError:
+            # Slave hidup, hanya menolak request
+            breaker.record_success()
+            raise
+        except IOError:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return response
+
+    async def _wait_quiet(self, loop):
+        """Tunggu jeda t3.5 dan sisa respons telat dari transaksi sebelumnya"""
+        while True:
+            wait = (
+                max(self._last_io + self.silent_interval, self._quiet_until)
+                - loop.time()
+            )
+            if wait <= 0:
+                return
+            # Dibangunkan _on_readable begitu byte telat masuk
+            self._quiet_waiter = loop.create_future()
+            try:
+                await asyncio.wait_for(self._quiet_waiter, wait)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._quiet_waiter = None
+
+    async def _exchange(
+        self, slave, request, expected_len, turnaround=None, deadline=None
+    ):
+        """
+        Kirim satu request (frame dari FrameEncoder) dan tunggu respons
+        sepanjang expected_len byte. Respons berupa memoryview ke buffer
+        penerima, valid sampai transaksi berikutnya di port ini.
+        turnaround opsional menggantikan budget waktu proses terukur
+        (misalnya untuk baca pertama saat startup). deadline opsional
+        (waktu loop/monotonic) memotong timeout supaya bus bebas lagi
+        sebelum poll input pulse berikutnya; setelah timeout yang dipotong,
+        port tidak didiamkan menunggu respons telat.
+        """
+        if self._faulted:
+            self._reattach()
+        if self._fd is None:
+            raise IOError(f"Port {self.port} belum dibuka di event loop")
+        if self._waiter is not None:
+            raise RuntimeError(f"Transaksi paralel di port {self.port}")
+
+        loop = asyncio.get_running_loop()
+        await self._wait_quiet(loop)
+
+        self.ser.reset_input_buffer()
+        self._rx_len = 0
+        self._expected = expected_len
+        self._waiter = loop.create_future()
+        self._late = None
+        request_time = len(request) * self.char_time
+        timeout = self.timeout_for(slave, len(request), expected_len, turnaround)
+        started = loop.time()
+        clamped = False
+        if deadline is not None and started + timeout > deadline:
+            # Minimal cukup untuk frame di kabel + waktu proses tersingkat
+            shortest = self.timeout_for(
+                slave, len(request), expected_len, MIN_TURNAROUND
+            )
+            timeout = max(deadline - started, shortest)
+            clamped = True
+        try:
+            self.ser.write(request)
+            response = await asyncio.wait_for(self._waiter, timeout)
+        except asyncio.TimeoutError:
+            waited = timeout - request_time
+            self._on_timeout(slave, started + request_time, waited, clamped)
+            raise IOError(
+                f"No response dari slave {slave} di {self.port} "
+                f"({self._rx_len}/{expected_len} byte, timeout {timeout * 1000:.0f} ms)"
+            )
+        except OSError as e:
+            # Error dari port (write gagal / fd putus), bukan dari slave
+            self._fault()
+            raise IOError(f"Port {self.port} error: {e}")
+        finally:
+            self._waiter = None
+            self._last_io = loop.time()
+
+        elapsed = self._last_io - started
+        self._record_latency(
+            slave, elapsed - (len(request) + len(response)) * self.char_time
+        )
+        check_response(response, request)
+        return response
+
+    def timeout_for(self, slave, request_len, response_len, turnaround=None):
+        """Timeout transaksi = waktu frame di kabel + t3.5 + waktu proses slave"""
+        frame_time = (request_len + response_len) * self.char_time
+        if turnaround is None:
+            turnaround = self.turnaround(slave)
+        return frame_time + self.silent_interval + turnaround
+
+    def turnaround(self, slave):
+        samples = self.latencies.get(slave)
+        if not samples:
+            return PROBE_TURNAROUND
+        ordered = sorted(samples)
+        if len(ordered) < MIN_SAMPLES:
+            # Sampel masih sedikit: sampel terlama dengan margin ganda
+            budget = ordered[-1] * LATENCY_MARGIN * 2
+        else:
+            index = min(len(ordered) - 1, int(len(ordered) * LATENCY_PERCENTILE))
+            budget = ordered[index] * LATENCY_MARGIN
+        return min(max(budget, MIN_TURNAROUND), MAX_TURNAROUND)
+
+    def max_turnaround(self, slave):
+        """Batas waktu respons telat slave: sampel terlama dengan margin"""
+        samples = self.latencies.get(slave)
+        if not samples:
+            return PROBE_TURNAROUND
+        return min(max(samples) * LATENCY_MARGIN, MAX_TURNAROUND)
+
+    def _record_latency(self, slave, latency):
+        samples = self.latencies.get(slave)
+        if samples is None:
+            samples = self.latencies[slave] = deque(maxlen=LATENCY_WINDOW)
+        samples.append(max(latency, 0.0))
+
+    def _on_timeout(self, slave, sent_at, waited, clamped=False):
+        # Respons yang telat bisa masih di jalan: port didiamkan sampai
+        # batas turnaround slave supaya tidak terbaca sebagai respons
+        # transaksi berikutnya. Byte telat yang masuk dicatat sebagai sampel
+        # latency (budget melebar) dan mengakhiri jeda lebih awal. Timeout
+        # yang dipotong deadline tidak didiamkan: poll pulse lebih penting,
+        # respons telat yang bertabrakan ditolak check_response.
+        self._late = (slave, sent_at)
+        if clamped:
+            self._quiet_until = sent_at + waited
+        else:
+            self._quiet_until = sent_at + max(self.max_turnaround(slave), waited)
+
+    def latency_stats(self):
+        """Ringkasan per slave: latency p95 terukur dan timeout yang dipakai"""
+        stats = {}
+        for slave in self.latencies:
+            samples = sorted(self.latencies.get(slave, ()))
+            p95 = samples[int(len(samples) * LATENCY_PERCENTILE)] if samples else None
+            stats[slave] = {
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "timeout_ms": round(self.timeout_for(slave, 8, 8) * 1000, 1),
+            }
+        return stats
+
+    async def read_registers(
+        self,
+        slave,
+        address,
+        count,
+        functioncode=3,
+        decode=None,
+        turnaround=None,
+        deadline=None,
+    ):
+        """
+        Nilai register (tuple). decode(frame) opsional dipanggil langsung atas
+        buffer respons, misalnya DecodePlan dari registerdriver.
+        """
+        request = self._encoder.read_request(slave, functioncode, address, count)
+        response = await self._transact(
+            slave,
+            request,
+            response_length(functioncode, count),
+            turnaround,
+            deadline,
+        )
+        if decode is not None:
+            return decode(response)
+        return decode_registers(response, count)
+
+    async def read_bits(self, slave, address, count, functioncode=2, deadline=None):
+        request = self._encoder.read_request(slave, functioncode, address, count)
+        response = await self._transact(
+            slave, request, response_length(functioncode, count), deadline=deadline
+        )
+        return decode_bits(response, count)
+
+    async def write_register(self, slave, address, value):
+        request = self._encoder.write_register_request(slave, address, value)
+        await self._transact(slave, request, response_length(6, 1))
+
+    async def write_registers(self, slave, address, values):
+        request = self._encoder.write_registers_request(slave, address, values)
+        await self._transact(slave, request, response_length(16, len(values)))
@@ -0,0 +1,79 @@
+import asyncio
+
+from asyncrtu import AsyncRTUClient
+from rtucodec import response_length
+
+
+class BusArbiter:
+    """
+    Pengatur akses bus RS485.
+    Satu client dan satu lock per port serial: transaksi di port yang sama
+    antri, sedangkan port yang berbeda (bus fisik terpisah) jalan bersamaan
+    di event loop yang sama. Port serial dimiliki PortManager, arbiter
+    hanya meminjam satu file descriptor per port.
+    """
+
+    def __init__(self, port_manager, breaker=None):
+        self.port_manager = port_manager
+        self.clients = {
+            port: AsyncRTUClient(ser, breaker=breaker, reopen=port_manager.reopen)
+            for port, ser in port_manager.items()
+        }
+        self.locks = {port: asyncio.Lock() for port in self.clients}
+
+    def open(self):
+        for client in self.clients.values():
+            client.open()
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+
+    def lock(self, port):
+        return self.locks[port]
+
+    def client(self, port):
+        return self.clients[port]
+
+    async def read_span(self, span, deadline=None):
+        """
+        Jalankan satu span hasil spanplanner sebagai satu transaksi.
+        deadline (monotonic) opsional membatasi timeout, lihat
+        PollScheduler.window.
+        """
+        client = self.clients[span.port]
+        async with self.lock(span.port):
+            if span.functioncode in (1, 2):
+                return await client.read_bits(
+                    span.slave,
+                    span.start,
+                    span.count,
+                    span.functioncode,
+                    deadline=deadline,
+                )
+            return await client.read_registers(
+                span.slave,
+                span.start,
+                span.count,
+                span.functioncode,
+                span.plan,
+                deadline=deadline,
+            )
+
+    def span_budget(self, span):
+        """Lama terburuk satu transaksi span: jeda t3.5 + timeout client"""
+        client = self.clients[span.port]
+        expected = response_length(span.functioncode, span.count)
+        return client.silent_interval + client.timeout_for(span.slave, 8, expected)
+
+    def breaker_states(self):
+        """State circuit breaker semua slave, key port_slave"""
+        states = {}
+        for client in self.clients.values():
+            for breaker in client.breakers.values():
+                states[breaker.key] = breaker.snapshot()
+        return states
+
+    @property
+    def ports(self):
+        return list(self.locks)
@@ -0,0 +1,197 @@
+import math
+from array import array
+from bisect import bisect_right
+
+ADC_SIZE = 4096  # ADC 12 bit Wellpro: raw 0..4095
+RAW_TO_MA = 20.0 / (ADC_SIZE - 1)  # raw ADC -> mA
+CALIBRATION_TYPES = ("piecewise", "polynomial")
+CALIBRATION_INPUTS = ("mA", "raw")
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_calibration(calibration):
+    """
+    Periksa blok "calibration" sensor 4-20mA, ValueError jika salah:
+      {"type": "piecewise", "input": "mA", "points": [[4, 0], [12, 6.8], ...]}
+      {"type": "polynomial", "input": "raw", "coefficients": [c0, c1, c2, ...]}
+    Titik piecewise urut naik menurut x; di luar titik pertama/terakhir
+    nilainya ditahan. Polynomial: c0 + c1*x + c2*x^2 + ...
+    output_min/output_max opsional untuk menjepit hasil.
+    """
+    if not isinstance(calibration, dict):
+        raise ValueError("calibration harus berupa object")
+    kind = calibration.get("type", "piecewise")
+    if kind not in CALIBRATION_TYPES:
+        raise ValueError(
+            f"calibration.type '{kind}' tidak dikenal "
+            f"(pilihan: {', '.join(CALIBRATION_TYPES)})"
+        )
+    if calibration.get("input", "mA") not in CALIBRATION_INPUTS:
+        raise ValueError(
+            f"calibration.input harus salah satu dari {', '.join(CALIBRATION_INPUTS)}"
+        )
+    for field in ("output_min", "output_max"):
+        if field in calibration and not _is_number(calibration[field]):
+            raise ValueError(f"calibration.{field} wajib berupa angka")
+
+    if kind == "piecewise":
+        points = calibration.get("points")
+        if not isinstance(points, list) or len(points) < 2:
+            raise ValueError("calibration.points wajib berupa list minimal 2 titik")
+        for point in points:
+            if (
+                not isinstance(point, (list, tuple))
+                or len(point) != 2
+                or not all(_is_number(v) for v in point)
+            ):
+                raise ValueError(f"titik kalibrasi {point} harus [x, y] berupa angka")
+        xs = [point[0] for point in points]
+        if any(b <= a for a, b in zip(xs, xs[1:])):
+            raise ValueError("x titik kalibrasi harus urut naik tanpa duplikat")
+    else:
+        coefficients = calibration.get("coefficients")
+        if (
+            not isinstance(coefficients, list)
+            or not coefficients
+            or not all(_is_number(c) for c in coefficients)
+        ):
+            raise ValueError("calibration.coefficients wajib berupa list angka")
+
+
+def calibration_curve(calibration):
+    """Fungsi x -> nilai teknik dari blok calibration yang sudah valid"""
+    if calibration.get("type", "piecewise") == "polynomial":
+        coefficients = tuple(reversed(calibration["coefficients"]))
+
+        def curve(x):
+            value = 0.0
+            for c in coefficients:
+                value = value * x + c
+            return value
+
+    else:
+        xs = [float(point[0]) for point in calibration["points"]]
+        ys = [float(point[1]) for point in calibration["points"]]
+        last = len(xs) - 1
+
+        def curve(x):
+            i = bisect_right(xs, x)
+            if i == 0:
+                return ys[0]
+            if i > last:
+                return ys[last]
+            x0, y0 = xs[i - 1], ys[i - 1]
+            return y0 + (x - x0) * (ys[i] - y0) / (xs[i] - x0)
+
+    lo = calibration.get("output_min", -math.inf)
+    hi = calibration.get("output_max", math.inf)
+    if lo == -math.inf and hi == math.inf:
+        return curve
+    return lambda x: max(lo, min(curve(x), hi))
+
+
+class CalibrationTable:
+    """
+    Lookup table 4096 entri raw ADC -> nilai teknik untuk satu channel,
+    dihitung sekali dari blok calibration. Konversi saat baca cukup
+    table[raw]. Saat kalibrasi diganti (lewat MQTT) hanya rentang raw yang
+    terpengaruh titik yang berubah yang dihitung ulang, ditulis dengan satu
+    slice assignment sehingga pembaca di thread lain tidak pernah melihat
+    tabel setengah jadi.
+    """
+
+    def __init__(self, calibration):
+        self.table = array("d", bytes(8 * ADC_SIZE))
+        self.calibration = None
+        self.update(calibration)
+
+    def scale(self, calibration):
+        """Faktor raw -> x kurva"""
+        return RAW_TO_MA if calibration.get("input", "mA") == "mA" else 1.0
+
+    def changed_range(self, calibration):
+        """Rentang raw [lo, hi) yang harus dihitung ulang untuk kalibrasi baru"""
+        old = self.calibration
+        if old is None or any(
+            old.get(field) != calibration.get(field)
+            for field in ("type", "input", "output_min", "output_max")
+        ):
+            return 0, ADC_SIZE
+        if calibration.get("type", "piecewise") != "piecewise":
+            if old.get("coefficients") == calibration.get("coefficients"):
+                return 0, 0
+            return 0, ADC_SIZE
+        old_points, new_points = old["points"], calibration["points"]
+        if len(old_points) != len(new_points):
+            return 0, ADC_SIZE
+        changed = [
+            i
+            for i, (a, b) in enumerate(zip(old_points, new_points))
+            if list(a) != list(b)
+        ]
+        if not changed:
+            return 0, 0
+
+        # Titik i hanya mempengaruhi segmen (i-1, i) dan (i, i+1); titik
+        # tetangga di luar rentang yang berubah sama di kalibrasi lama & baru
+        first, last = changed[0], changed[-1]
+        scale = self.scale(calibration)
+        lo = 0
+        if first > 0:
+            lo = max(0, math.floor(new_points[first - 1][0] / scale))
+        hi = ADC_SIZE
+        if last + 1 < len(new_points):
+            hi = min(ADC_SIZE, math.ceil(new_points[last + 1][0] / scale) + 1)
+        return lo, max(lo, hi)
+
+    def update(self, calibration):
+        """Pasang kalibrasi baru; jumlah entri tabel yang dihitung ulang"""
+        validate_calibration(calibration)
+        lo, hi = self.changed_range(calibration)
+        if hi > lo:
+            curve = calibration_curve(calibration)
+            scale = self.scale(calibration)
+            self.table[lo:hi] = array(
+                "d", [curve(raw * scale) for raw in range(lo, hi)]
+            )
+        self.calibration = calibration
+        return hi - lo
+
+    def __call__(self, raw):
+        return self.table[raw if raw < ADC_SIZE else ADC_SIZE - 1]
+
+
+if __name__ == "__main__":
+    # Benchmark tabel kalibrasi: python calibration.py
+    # (kebenaran tabel diuji di test_calibration.py)
+    import time
+
+    ph = {"type": "piecewise", "points": [[4, 0], [8, 3.9], [12, 7.1], [20, 14]]}
+    table = CalibrationTable(ph)
+    curve = calibration_curve(ph)
+
+    # Ubah satu titik: hanya segmen di sekitarnya dihitung ulang
+    moved = {"type": "piecewise", "points": [[4, 0], [8, 4.0], [12, 7.1], [20, 14]]}
+    rebuilt = CalibrationTable(ph).update(moved)
+    print(f"ubah 1 titik: {rebuilt}/{ADC_SIZE} entri dihitung ulang")
+
+    N = 200000
+    raws = [(123 * i) % ADC_SIZE for i in range(64)]
+    for label, convert in (
+        ("kurva piecewise", lambda raw: curve(raw * RAW_TO_MA)),
+        ("lookup table", table),
+        ("index langsung", table.table.__getitem__),
+    ):
+        started = time.perf_counter()
+        for _ in range(N // len(raws)):
+            for raw in raws:
+                convert(raw)
+        elapsed = time.perf_counter() - started
+        print(f"{label:<16} {elapsed / N * 1e9:8.1f} ns per konversi")
+
+    started = time.perf_counter()
+    CalibrationTable(ph)
+    print(f"bangun tabel penuh {(time.perf_counter() - started) * 1000:.2f} ms")
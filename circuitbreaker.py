@@ -0,0 +1,89 @@
+import time
+
+DEFAULT_THRESHOLD = 3  # gagal berturut-turut sebelum circuit dibuka
+DEFAULT_BACKOFF = 5.0  # jeda probe pertama (detik)
+DEFAULT_MAX_BACKOFF = 300.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(IOError):
+    """Slave sedang dianggap mati, transaksi ditolak tanpa menyentuh bus"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker untuk satu slave (key port_slave).
+
+    Setelah `threshold` kegagalan berturut-turut circuit terbuka dan semua
+    transaksi ke slave itu langsung ditolak. Setelah jeda backoff satu
+    transaksi dibolehkan sebagai probe (half open): berhasil berarti circuit
+    tertutup lagi, gagal berarti terbuka lagi dengan jeda dua kali lipat.
+    """
+
+    def __init__(
+        self,
+        key,
+        threshold=DEFAULT_THRESHOLD,
+        backoff=DEFAULT_BACKOFF,
+        max_backoff=DEFAULT_MAX_BACKOFF,
+    ):
+        self.key = key
+        self.threshold = threshold
+        self.base_backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.state = CLOSED
+        self.failures = 0
+        self.backoff = backoff
+        self.retry_at = 0.0
+
+    def allow(self):
+        if self.state == OPEN:
+            if time.monotonic() < self.retry_at:
+                return False
+            self.state = HALF_OPEN
+        return True
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(
+                f"Circuit {self.key} terbuka, probe lagi dalam "
+                f"{self.retry_at - time.monotonic():.0f}s"
+            )
+
+    def record_success(self):
+        if self.state != CLOSED:
+            print(f"✅ Circuit {self.key} tertutup, slave menjawab lagi")
+        self.state = CLOSED
+        self.failures = 0
+        self.backoff = self.base_backoff
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            self._open()
+        elif self.state == CLOSED and self.failures >= self.threshold:
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.retry_at = time.monotonic() + self.backoff
+        print(
+            f"🔌 Circuit {self.key} terbuka setelah {self.failures} kegagalan, "
+            f"probe lagi dalam {self.backoff:.1f}s"
+        )
+
+    def snapshot(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_in": (
+                round(max(self.retry_at - time.monotonic(), 0.0), 1)
+                if self.state == OPEN
+                else 0
+            ),
+        }
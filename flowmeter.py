@@ -1,116 +1,166 @@
-from sys import set_coroutine_origin_tracking_depth
-import crcmod
+import asyncio
 import time
-import struct
-import minimalmodbus
-import threading
+
+# Parameter penampang RS-RAD -> alamat holding register
+SECTION_REGISTERS = (
+    ("section_type", 1042),
+    ("size1", 1043),
+    ("size2", 1044),
+    ("size3", 1045),
+    ("height_sensor", 1058),
+)
+# Baca verifikasi saat startup: transaksi pertama ke RS-RAD, jadi budget
+# waktu proses belum terukur. Diberi waktu lebar & dicoba ulang sebelum
+# menyerah ke "tulis semua" (yang membuat EEPROM aus).
+SETUP_TURNAROUND = 3.0
+SETUP_READ_ATTEMPTS = 2
+
+
+def register_runs(changed):
+    """{alamat: nilai} -> [(alamat awal, [nilai, ...])] per deret berurutan"""
+    runs = []
+    for address in sorted(changed):
+        if runs and runs[-1][0] + len(runs[-1][1]) == address:
+            runs[-1][1].append(changed[address])
+        else:
+            runs.append((address, [changed[address]]))
+    return runs
+
+
+def device_slaves(device):
+    """
+    Alamat slave RS-RAD di device: slave_address tiap sensor, sumber yang
+    sama dengan pembacaan (spanplanner) dan validasi (sensorconfig).
+    Default 1 jika tidak ada sensor sama sekali.
+    """
+    slaves = []
+    for sensor in device.get("sensors", []):
+        slave = sensor.get("slave_address")
+        if slave is not None and slave not in slaves:
+            slaves.append(slave)
+    return slaves or [1]
 
 
 class Flowmeter:
-    def __init__(self, ser_ports, config):
+    """
+    Setup RS-RAD (radar flowmeter): konfigurasi penampang dikirim ke tiap
+    device rs_rad di config. Tiap device jadi instrument sendiri dengan key
+    port#slave, jadi beberapa flowmeter di port sama (slave berbeda) maupun
+    di port berbeda didukung. Pembacaan nilainya lewat RegisterDriver.
+    """
+
+    def __init__(self, config, arbiter):
         self.config = config
-        self.ser_ports = ser_ports
         self.instruments = {}
-        self.last_key = ""
-        self.lock = threading.Lock()
-
-        # Data & waktu terakhir tiap sensor
-        self.sensor_data = {
-            "debit": {"value": 0, "time": 0},
-            "water_height": {"value": 0, "time": 0},
-            "velocity": {"value": 0, "time": 0},
-        }
+        self.arbiter = arbiter
 
         for device in config["devices"]:
             if (
                 "rs_rad" in device["name"].lower()
                 and "direct_rs485" in device["type"].lower()
             ):
-                print("======================================")
-                print(device["type"])
-                print(device["name"])
-                print("======================================")
                 port = device["port"]
-                slave_addr = 1
-                key = f"{port}"
-                instr = minimalmodbus.Instrument(port, slave_addr)
-                instr.serial.baudrate = ser_ports[port].baudrate
-                instr.serial.bytesize = ser_ports[port].bytesize
-                instr.serial.parity = ser_ports[port].parity
-                instr.serial.stopbits = ser_ports[port].stopbits
-                instr.serial.timeout = 3
-                instr.mode = minimalmodbus.MODE_RTU
-                self.last_key = key
-                self.instruments[key] = instr
-
-                print("======================================")
-                print(self.instruments)
-                print("======================================")
-                self.set_section_config(instr, device["section_parameters"])
-
-                break
-
-    def read_sensor_data(self, sensor, port):
-        """Baca semua data sensor"""
-        name = sensor["name"]
-        instr = self.instruments[self.last_key]
-
-        with self.lock:
-            now = time.time()
-            last_time = self.sensor_data[name]["time"]
-
-            # kalau belum 60 detik, return cached value
-            if now - last_time < 60:
-                return self.sensor_data[name]["value"]
-
-            # sudah lewat 60 detik -> baca ulang
-            try:
-                if name == "water_height":
-                    depth_info = instr.read_register(1003, 0, functioncode=3)
-                    if depth_info:
-                        val = depth_info / 1000.0
-                        if val == 0:
-                            return self.sensor_data[name]["value"]
-
-                        self.sensor_data[name] = {"value": val, "time": now}
-                        return val
-
-                elif name == "velocity":
-                    velocity_cms = instr.read_register(1004, 0, functioncode=3)
-                    val = velocity_cms * 0.01  # dari cm ke meter
-                    if val == 0:
-                        return self.sensor_data[name]["value"]
-                    self.sensor_data[name] = {"value": val, "time": now}
-                    return val
-
-                elif name == "debit":
-                    flow_raw = instr.read_register(1002, 0, functioncode=3)
-                    val = flow_raw / 1000.0
-                    if val == 0:
-                        return self.sensor_data[name]["value"]
-                    self.sensor_data[name] = {"value": val, "time": now}
-                    return val
-
-            except Exception as e:
-                print(f"❌ Gagal baca {name}:", e)
-                return self.sensor_data[name]["value"]
+                slaves = device_slaves(device)
+                if device.get("slave_address", slaves[0]) not in slaves:
+                    print(
+                        f"⚠️ {device['name']}: slave_address device "
+                        f"{device['slave_address']} diabaikan, dipakai slave "
+                        f"sensornya {', '.join(map(str, slaves))}"
+                    )
+                for slave_addr in slaves:
+                    key = f"{port}#{slave_addr}"
+                    if key in self.instruments:
+                        print(f"⚠️ RS-RAD {key} muncul dua kali di config, diabaikan")
+                        continue
+                    self.instruments[key] = {
+                        "name": device["name"],
+                        "port": port,
+                        "slave_address": slave_addr,
+                        "section_parameters": device.get("section_parameters"),
+                    }
+
+        print(f"🌊 {len(self.instruments)} RS-RAD: {', '.join(self.instruments)}")
+
+    async def setup(self):
+        """
+        Kirim konfigurasi penampang ke semua sensor (butuh event loop
+        berjalan). Port berbeda dikonfigurasi bersamaan, slave di port yang
+        sama bergantian.
+        """
+        per_port = {}
+        for instr in self.instruments.values():
+            if instr["port"] not in self.arbiter.clients:
+                print(f"⚠️ Port {instr['port']} tidak dibuka, setup RS-RAD dilewati")
+            elif instr["section_parameters"]:
+                per_port.setdefault(instr["port"], []).append(instr)
+        started = time.monotonic()
+        await asyncio.gather(
+            *(self.setup_port(port, instrs) for port, instrs in per_port.items())
+        )
+        if per_port:
+            print(
+                f"⚙️ Setup RS-RAD selesai dalam "
+                f"{(time.monotonic() - started) * 1000:.1f} ms"
+            )
 
-    def set_section_config(self, instr, section_parameters):
+    async def setup_port(self, port, instruments):
+        async with self.arbiter.lock(port):
+            for instr in instruments:
+                await self.set_section_config(instr, instr["section_parameters"])
+
+    async def set_section_config(self, instr, section_parameters):
+        """
+        Verify-before-write: blok parameter dibaca dalam satu transaksi,
+        dibandingkan dengan config, lalu hanya register yang berbeda ditulis
+        (fc 16 per deret alamat berurutan). Kalau sudah sama, tidak ada
+        penulisan sama sekali sehingga EEPROM sensor tidak ikut aus.
+        """
+        key = f"{instr['port']}#{instr['slave_address']}"
+        started = time.monotonic()
         try:
-            print("=========================instr")
-            print(instr)
-            print("=========================instr")
-
-            instr.write_register(
-                1042, section_parameters["section_type"], functioncode=6
-            )
-            instr.write_register(1043, section_parameters["size1"], functioncode=6)
-            instr.write_register(1044, section_parameters["size2"], functioncode=6)
-            instr.write_register(1045, section_parameters["size3"], functioncode=6)
-            instr.write_register(
-                1058, section_parameters["height_sensor"], functioncode=6
+            client = self.arbiter.client(instr["port"])
+            slave_addr = instr["slave_address"]
+            wanted = {
+                address: int(section_parameters[name])
+                for name, address in SECTION_REGISTERS
+                if name in section_parameters
+            }
+            if not wanted:
+                return True
+
+            first = min(wanted)
+            current = None
+            for attempt in range(1, SETUP_READ_ATTEMPTS + 1):
+                try:
+                    current = await client.read_registers(
+                        slave_addr,
+                        first,
+                        max(wanted) - first + 1,
+                        turnaround=SETUP_TURNAROUND,
+                    )
+                    break
+                except Exception as e:
+                    print(
+                        f"⚠️ Section config {key} tidak terbaca "
+                        f"(percobaan {attempt}/{SETUP_READ_ATTEMPTS}): {e}"
+                    )
+            if current is None:
+                print(f"⚠️ Section config {key} tetap tidak terbaca, tulis semua")
+                changed = wanted
+            else:
+                changed = {
+                    address: value
+                    for address, value in wanted.items()
+                    if current[address - first] != value
+                }
+
+            for start, values in register_runs(changed):
+                await client.write_registers(slave_addr, start, values)
+            print(
+                f"⚙️ Section config {key}: {len(changed)}/{len(wanted)} register "
+                f"ditulis dalam {(time.monotonic() - started) * 1000:.1f} ms"
             )
             return True
         except Exception as e:
-            print("❌ Gagal set section config:", e)
+            print(f"❌ Gagal set section config {key}:", e)
             return False
@@ -1,5 +1,4 @@
 import serial
-import crcmod
 import time
 import json
 import requests
@@ -7,6 +6,7 @@ import paho.mqtt.client as mqtt
 from datetime import datetime
 import Adafruit_SSD1306
 from PIL import Image, ImageDraw, ImageFont
+from rtucodec import FrameEncoder, crc16, decode_registers
 
 # ==============================
 # Konfigurasi Serial Modbus
@@ -20,7 +20,7 @@ ser = serial.Serial(
     timeout=1,
 )
 
-crc16 = crcmod.mkCrcFun(0x18005, rev=True, initCrc=0xFFFF, xorOut=0x0000)
+encoder = FrameEncoder()
 
 # ==============================
 # Konfigurasi OLED
@@ -107,18 +107,7 @@ def display_message(line1, top_margin=8, bottom_margin=8):
 # Fungsi Baca Modbus
 # ==============================
 def read_analog_channel(slave_address, channel_address):
-    frame = bytes(
-        [
-            slave_address,
-            0x03,
-            (channel_address >> 8) & 0xFF,
-            channel_address & 0xFF,
-            0x00,
-            0x01,
-        ]
-    )
-    crc = crc16(frame).to_bytes(2, "little")
-    return frame + crc
+    return encoder.read_request(slave_address, 0x03, channel_address, 1)
 
 
 # ==============================
@@ -193,10 +182,9 @@ try:
             response = ser.read(7)
 
             if len(response) == 7:
-                received_crc = int.from_bytes(response[-2:], "little")
-                calculated_crc = crc16(response[:-2])
-                if received_crc == calculated_crc:
-                    raw_value = int.from_bytes(response[3:5], "big")
+                # CRC atas seluruh frame (termasuk CRC) = 0 jika valid
+                if crc16(response) == 0:
+                    (raw_value,) = decode_registers(response, 1)
                     current = (raw_value * 20) / 4095
                     print(f"[AI_{i + 1}] Arus: {current:.2f} mA", end=" ")
 
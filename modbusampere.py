@@ -1,61 +1,267 @@
-import minimalmodbus
-import serial
-import threading
+import struct
+
+from calibration import ADC_SIZE, RAW_TO_MA, CalibrationTable
+from circuitbreaker import CircuitOpenError
+
+try:
+    # Opsional: konversi satu snapshot register semua channel sekaligus
+    import numpy as np
+except ImportError:
+    np = None
+
+NUMPY_MIN_CHANNELS = 16  # di bawah ini overhead numpy lebih mahal
+LINEAR_FIELDS = ("input_min", "input_max", "output_min", "output_max")
+UNCONVERTED = (0.0, 0.0, 0.0, 0.0)  # channel yang hanya punya calibration
+
+
+def analog_coefficients(conv):
+    """
+    Konversi linear 4-20mA dikompilasi jadi (slope, offset, lo, hi):
+    nilai = raw * slope + offset, dijepit ke output_min..output_max
+    """
+    in_min, in_max = conv["input_min"], conv["input_max"]
+    out_min, out_max = conv["output_min"], conv["output_max"]
+    gain = (out_max - out_min) / (in_max - in_min)
+    return RAW_TO_MA * gain, out_min - in_min * gain, out_min, out_max
+
+
+def sensor_coefficients(sensor):
+    conv = sensor.get("conversion", {})
+    if all(field in conv for field in LINEAR_FIELDS):
+        return analog_coefficients(conv)
+    return UNCONVERTED
+
+
+class AnalogPlan:
+    """
+    Rencana konversi satu span analog (semua channel 4-20mA satu slave),
+    dikompilasi saat config dimuat. Interface sama dengan DecodePlan:
+    __call__(frame) memberi snapshot register, values(raw) nilai per key.
+    Channel yang punya CalibrationTable dikonversi lewat lookup table,
+    menimpa hasil linear-nya.
+    """
+
+    def __init__(self, span, tables=None, use_numpy=None):
+        entries = sorted(
+            (offset, key, sensor_coefficients(sensor))
+            for key, device, sensor, offset in span.entries
+        )
+        self.keys = tuple(key for _, key, _ in entries)
+        self.offsets = tuple(offset for offset, _, _ in entries)
+        coefficients = [coef for _, _, coef in entries]
+        self.slopes, self.intercepts, self.lows, self.highs = zip(*coefficients)
+        self.count = span.count
+        self.registers = struct.Struct(f">{span.count}H")
+        self.missing = [None] * len(entries)
+
+        if use_numpy is None:
+            use_numpy = len(entries) >= NUMPY_MIN_CHANNELS
+        self.numpy = use_numpy and np is not None
+        if self.numpy:
+            self.index = np.array(self.offsets, dtype=np.intp)
+            self.np_slopes = np.array(self.slopes)
+            self.np_intercepts = np.array(self.intercepts)
+            self.np_lows = np.array(self.lows)
+            self.np_highs = np.array(self.highs)
+            self.values = self.values_numpy
+        else:
+            self.rows = tuple(zip(self.offsets, *zip(*coefficients)))
+
+        # (posisi hasil, offset register, array tabel) per channel terkalibrasi
+        self.luts = ()
+        for key, table in (tables or {}).items():
+            self.set_table(key, table)
+
+    def set_table(self, key, table):
+        """
+        Pasang/lepas (table None) lookup table channel key. self.luts diganti
+        utuh dalam satu assignment, aman dipanggil dari thread MQTT.
+        """
+        if key not in self.keys:
+            return
+        position = self.keys.index(key)
+        luts = [lut for lut in self.luts if lut[0] != position]
+        if table is not None:
+            luts.append((position, self.offsets[position], table.table))
+        self.luts = tuple(luts)
+
+    def __call__(self, frame):
+        """Snapshot register span dari frame respons fc 3/4"""
+        if self.numpy:
+            return np.frombuffer(frame, ">u2", self.count, 3)
+        return self.registers.unpack_from(frame, 3)
+
+    def values(self, raw):
+        """Nilai teknik per channel (urutan self.keys); None jika baca gagal"""
+        if raw is None:
+            return self.missing
+        values = [
+            max(lo, min(raw[offset] * slope + intercept, hi))
+            for offset, slope, intercept, lo, hi in self.rows
+        ]
+        for position, offset, table in self.luts:
+            value = raw[offset]
+            values[position] = table[value if value < ADC_SIZE else ADC_SIZE - 1]
+        return values
+
+    def values_numpy(self, raw):
+        if raw is None:
+            return self.missing
+        scaled = raw[self.index] * self.np_slopes + self.np_intercepts
+        values = np.maximum(self.np_lows, np.minimum(scaled, self.np_highs)).tolist()
+        for position, offset, table in self.luts:
+            value = int(raw[offset])
+            values[position] = table[value if value < ADC_SIZE else ADC_SIZE - 1]
+        return values
 
 
 class Modbusampere:
-    def __init__(self, ser_ports, config):
-        self.ser_ports = ser_ports
+    def __init__(self, config, arbiter):
         self.config = config
-        self.instruments = {}
-        self.lock = threading.Lock()
-
-        for device in config["devices"]:
-            if "modbusampere" in device["name"].lower():
-                port = device["port"]
-                for sensor in device["sensors"]:
-                    slave_addr = sensor["slave_address"]
-                    key = f"{port}_{slave_addr}"
-                    if key not in self.instruments:
-                        instr = minimalmodbus.Instrument(port, slave_addr)
-                        instr.serial.baudrate = ser_ports[port].baudrate
-                        instr.serial.bytesize = ser_ports[port].bytesize
-                        instr.serial.parity = ser_ports[port].parity
-                        instr.serial.stopbits = ser_ports[port].stopbits
-                        instr.serial.timeout = 1
-                        instr.mode = minimalmodbus.MODE_RTU
-                        self.instruments[key] = instr
+        self.arbiter = arbiter
+        self.plans = []
 
-    # Analog 4-20mA
-    def read_analog(self, sensor, port):
-        slave_addr = sensor["slave_address"]
-        channel = sensor["channel"]
-        key = f"{port}_{slave_addr}"
-        instr = self.instruments[key]
+        # Lookup table kalibrasi per channel analog, key (d_idx, s_idx)
+        self.tables = {}
+        for key, sensor in self.analog_sensors():
+            if "calibration" in sensor:
+                self.tables[key] = CalibrationTable(sensor["calibration"])
+
+    def analog_sensors(self):
+        for d_idx, device in enumerate(self.config["devices"]):
+            if device["type"] != "modbus":
+                continue
+            for s_idx, sensor in enumerate(device["sensors"]):
+                if sensor["type"] == "4-20mA":
+                    yield (d_idx, s_idx), sensor
+
+    def compile(self, span):
+        """AnalogPlan untuk span holding register; span DI tetap lewat decode"""
+        if span.functioncode not in (3, 4):
+            return None
+        tables = {
+            key: self.tables[key]
+            for key, device, sensor, offset in span.entries
+            if key in self.tables
+        }
+        plan = AnalogPlan(span, tables)
+        self.plans.append(plan)
+        return plan
+
+    def calibrate(self, name, calibration):
+        """
+        Ganti kalibrasi channel analog bernama name (perintah MQTT);
+        calibration None kembali ke konversi linear. Tabel yang sudah ada
+        hanya dihitung ulang di rentang raw yang terpengaruh.
+        ValueError jika sensor tidak ada atau kalibrasinya tidak valid.
+        """
+        found = False
+        for key, sensor in self.analog_sensors():
+            if sensor["name"] != name:
+                continue
+            found = True
+            table = self.tables.get(key)
+            if calibration is None:
+                if sensor_coefficients(sensor) is UNCONVERTED:
+                    raise ValueError(f"{name} tidak punya conversion linear")
+                self.tables.pop(key, None)
+                sensor.pop("calibration", None)
+                table = None
+                print(f"🎯 Kalibrasi {name} dilepas, kembali ke conversion linear")
+            elif table is None:
+                table = self.tables[key] = CalibrationTable(calibration)
+                print(f"🎯 Kalibrasi {name}: tabel {ADC_SIZE} entri dibuat")
+            else:
+                rebuilt = table.update(calibration)
+                print(f"🎯 Kalibrasi {name}: {rebuilt}/{ADC_SIZE} entri dihitung ulang")
+            if calibration is not None:
+                sensor["calibration"] = calibration
+            for plan in self.plans:
+                plan.set_table(key, table)
+        if not found:
+            raise ValueError(f"sensor analog {name} tidak ditemukan")
+
+    def decode(self, sensor, values, offset):
+        """
+        Nilai sensor dari hasil baca span (lihat spanplanner).
+        Satu span melayani semua channel di slave yang sama.
+        """
+        if values is None:
+            return None
         try:
-            with self.lock:  # 🔒 hanya 1 thread yang bisa akses saat ini
-                values = instr.read_registers(0, 6, functioncode=3)
-            raw = values[channel]
-            current_ma = raw * 20.0 / 4095.0
-            conv = sensor["conversion"]
-            scaled = (current_ma - conv["input_min"]) / (
-                conv["input_max"] - conv["input_min"]
-            ) * (conv["output_max"] - conv["output_min"]) + conv["output_min"]
-            return max(conv["output_min"], min(scaled, conv["output_max"]))
+            if sensor["type"] == "4-20mA":
+                return self.convert_analog(sensor, values[offset])
+            elif sensor["type"] == "digital_in":
+                return bool(values[offset])
         except Exception as e:
-            print(f"Error baca analog {sensor['name']}: {e}")
-            return None
+            print(f"Error decode {sensor['name']}: {e}")
+        return None
+
+    # Analog 4-20mA
+    def convert_analog(self, sensor, raw):
+        slope, intercept, lo, hi = analog_coefficients(sensor["conversion"])
+        return max(lo, min(raw * slope + intercept, hi))
 
-    # Digital Input
-    def read_digital_inputs(self, sensor, port):
-        slave_addr = sensor["slave_address"]
-        channel = sensor["channel"]
-        key = f"{port}_{slave_addr}"
-        instr = self.instruments[key]
+    # Register pulse counter modul DI (mode counter RainCounter)
+    async def read_counter(self, sensor, port):
+        counter = sensor["counter"]
+        width = 2 if int(counter.get("width", 16)) == 32 else 1
         try:
-            with self.lock:  # 🔒 gunakan lock di sini juga
-                bits = instr.read_bits(0, 4, functioncode=2)
-            return bool(bits[channel])
+            async with self.arbiter.lock(port):
+                regs = await self.arbiter.client(port).read_registers(
+                    sensor["slave_address"],
+                    counter["register"],
+                    width,
+                    functioncode=counter.get("functioncode", 3),
+                )
+            if width == 2:
+                return (regs[0] << 16) | regs[1]
+            return regs[0]
+        except CircuitOpenError:
+            return None
         except Exception as e:
-            print(f"Error baca DI {sensor['name']}: {e}")
+            print(f"Error baca counter {sensor['name']}: {e}")
             return None
+
+
+if __name__ == "__main__":
+    # Benchmark konversi analog per span: python modbusampere.py
+    # (kesamaan hasil dengan jalur per sensor diuji di test_modbusampere.py)
+    import time
+
+    from spanplanner import ReadSpan
+
+    device = {"name": "modbusampere", "type": "modbus"}
+    for channels in (6, 16, 64):
+        span = ReadSpan("/dev/ttyUSB0", 1, 3, 0)
+        for channel in range(channels):
+            sensor = {
+                "name": f"ai{channel}",
+                "type": "4-20mA",
+                "channel": channel,
+                "conversion": {
+                    "input_min": 4,
+                    "input_max": 20,
+                    "output_min": 0,
+                    "output_max": 10 * (channel + 1),
+                },
+            }
+            span.add((0, channel), device, sensor, channel, 1)
+        registers = [(800 + 311 * channel) % 4096 for channel in range(channels)]
+        frame = bytes([1, 3, 2 * channels]) + struct.pack(f">{channels}H", *registers)
+
+        candidates = []
+        for label, use_numpy in (("slope/offset", False), ("numpy", True)):
+            plan = AnalogPlan(span, use_numpy=use_numpy)
+            if use_numpy and not plan.numpy:
+                continue
+            candidates.append((label, lambda plan=plan: plan.values(plan(frame))))
+
+        N = 50000
+        print(f"{channels} channel:")
+        for label, func in candidates:
+            started = time.perf_counter()
+            for _ in range(N):
+                func()
+            elapsed = time.perf_counter() - started
+            print(f"  {label:<14} {elapsed / N * 1e6:8.2f} µs per span")
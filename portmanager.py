@@ -0,0 +1,71 @@
+import time
+
+import serial
+
+
+class PortManager:
+    """
+    Pemilik tunggal semua port serial RS485.
+
+    Tiap port dibuka tepat sekali (exclusive, jadi proses lain tidak bisa
+    ikut membuka device yang sama) dan dibagikan ke semua driver lewat
+    BusArbiter. Port dibuka non-blocking karena pembacaan dilakukan oleh
+    event loop; kalau adapter USB sempat terlepas, port dibuka ulang. Port
+    yang gagal dibuka saat start dilewati (tidak ada di ports), device di
+    port itu tidak dipoll.
+    """
+
+    def __init__(self, serial_config):
+        self.serial_config = serial_config
+        self.ports = {}
+
+    def _open(self, port):
+        params = self.serial_config[port]
+        return serial.Serial(
+            port=port,
+            baudrate=params["baudrate"],
+            bytesize=params["bytesize"],
+            parity=params["parity"],
+            stopbits=params["stopbits"],
+            timeout=0,
+            exclusive=True,
+        )
+
+    def open(self):
+        started = time.monotonic()
+        for port in self.serial_config:
+            try:
+                self.ports[port] = self._open(port)
+            except serial.SerialException as e:
+                print(f"❌ Gagal buka port {port}: {e}")
+        print(
+            f"🔌 {len(self.ports)} port serial dibuka dalam "
+            f"{(time.monotonic() - started) * 1000:.1f} ms"
+        )
+        return self
+
+    def get(self, port):
+        return self.ports[port]
+
+    def reopen(self, port):
+        """Tutup lalu buka ulang port setelah error I/O"""
+        old = self.ports.pop(port, None)
+        if old is not None:
+            try:
+                old.close()
+            except Exception:
+                pass
+        self.ports[port] = self._open(port)
+        print(f"🔁 Port {port} dibuka ulang")
+        return self.ports[port]
+
+    def close(self):
+        for ser in self.ports.values():
+            try:
+                ser.close()
+            except Exception as e:
+                print(f"Error menutup {ser.port}: {e}")
+        self.ports = {}
+
+    def items(self):
+        return self.ports.items()
@@ -0,0 +1,389 @@
+import time
+from collections import deque
+
+from circuitbreaker import CircuitOpenError
+from scheduler import sensor_interval, sensor_priority
+
+PULSE_INTERVAL = 0.02  # periode sampling default input pulse (detik)
+PULSE_PRIORITY = 0
+PULSE_MIN_WIDTH = 0.02  # lebar pulse minimum default (detik)
+SAMPLES_PER_CLOSURE = 3  # sampel minimum per closure saat hujan/aktif
+DRY_SAMPLES = 2  # sampel minimum per closure saat kering
+DRY_AFTER = 600.0  # idle sekian detik dianggap cuaca kering
+MAX_PULSE_INTERVAL = 1.0  # batas atas periode sampling adaptif (detik)
+# Lebar closure default = min_width + PULSE_MARGIN (detik), dipakai sampai
+# closure pertama terukur; max_gap default = PULSE_MARGIN
+PULSE_MARGIN = 0.06
+WIDTH_HISTORY = 16  # jumlah lebar closure terakhir yang diingat
+WIDTH_SAFETY = 0.8  # cadangan untuk variasi mekanis lebar closure
+
+
+def is_pulse_sensor(sensor):
+    """
+    DI yang dihitung pulsenya: sensor dengan konfigurasi "pulse"
+    (mis. anemometer) atau rainfall yang tidak memakai counter hardware.
+    """
+    if sensor.get("type") != "digital_in":
+        return False
+    if "pulse" in sensor:
+        return True
+    return sensor["name"].lower() == "rainfall" and "counter" not in sensor
+
+
+def bank_for_input(banks, device, sensor):
+    """
+    PulseBank {(port, slave): bank} yang bisa melayani DI biasa ini dari
+    snapshot read_bits-nya (modul yang sama), None jika tidak ada.
+    """
+    if sensor.get("type") != "digital_in" or is_pulse_sensor(sensor):
+        return None
+    return banks.get((device["port"], sensor.get("slave_address")))
+
+
+class PulseChannel:
+    """
+    Satu input pulse (reed switch tipping bucket, anemometer) di modul DI.
+
+    Debounce berupa state machine berbasis waktu di atas aliran sampel
+    biasa: level baru diterima setelah terlihat terus-menerus selama
+    min_width, tanpa sleep atau baca ulang. Tiap transisi ke level aktif
+    dihitung satu pulse. Pulse yang lebih pendek dari min_width (chatter
+    kontak, spike) dibuang; pulse selebar min_width + periode sampling
+    selalu terhitung.
+
+    Lebar closure yang diterima ikut diukur supaya PulseBank bisa memilih
+    periode sampling paling lambat yang masih aman. Sebelum ada closure
+    terukur (mis. restart saat kemarau) dipakai lebar dari config
+    ("closure_ms", default min_width + PULSE_MARGIN). Tiap closure memberi
+    batas bawah (selisih sampel dikurangi jarak sampel di tepi turun); lebar
+    mekanis diperkirakan dari batas bawah terbesar di WIDTH_HISTORY closure
+    terakhir, dikali WIDTH_SAFETY.
+    """
+
+    def __init__(
+        self,
+        name,
+        channel,
+        active_low=True,
+        per_pulse=1.0,
+        min_width=PULSE_MIN_WIDTH,
+        samples=SAMPLES_PER_CLOSURE,
+        dry_after=DRY_AFTER,
+        closure=None,
+        on_pulse=None,
+    ):
+        self.name = name
+        self.channel = channel
+        self.active_low = active_low
+        self.per_pulse = per_pulse
+        self.min_width = min_width
+        self.samples = max(samples, DRY_SAMPLES)
+        self.dry_after = dry_after
+        self.on_pulse = on_pulse
+        if closure is None:
+            closure = min_width + PULSE_MARGIN
+        self.closure = closure  # lebar closure dari config (detik)
+
+        self.state = None  # level terkonfirmasi, None sampai sampel pertama
+        self._since = None  # waktu level baru pertama terlihat
+        self._since_gap = 0.0
+        self.count = 0
+
+        # Pengukuran lebar closure
+        self.widths = deque(maxlen=WIDTH_HISTORY)
+        self.closure_width = closure  # perkiraan lebar closure aman (detik)
+        self.last_pulse = None
+        self._first_t = None  # sampel pertama, acuan kering sebelum ada pulse
+        self._active_since = None
+        self._last_t = None
+
+        self._window_count = 0
+        self._window_start = time.monotonic()
+
+    @classmethod
+    def from_sensor(cls, sensor, on_pulse=None):
+        pulse = sensor.get("pulse", {})
+        return cls(
+            sensor["name"],
+            sensor["channel"],
+            active_low=pulse.get("active_low", True),
+            per_pulse=pulse.get("per_pulse", 1.0),
+            min_width=pulse.get("min_width_ms", PULSE_MIN_WIDTH * 1000) / 1000.0,
+            samples=pulse.get("samples_per_closure", SAMPLES_PER_CLOSURE),
+            dry_after=pulse.get("dry_after_s", DRY_AFTER),
+            closure=(pulse["closure_ms"] / 1000.0 if "closure_ms" in pulse else None),
+            on_pulse=on_pulse,
+        )
+
+    def feed(self, bit, t):
+        active = not bit if self.active_low else bool(bit)
+        previous_t, self._last_t = self._last_t, t
+        if self.state is None:
+            # Level awal saat start tidak dihitung sebagai pulse
+            self.state = active
+            self._first_t = t
+            return
+
+        if active == self.state:
+            # Level kembali sebelum min_width: glitch, batalkan kandidat
+            self._since = None
+            return
+
+        if self._since is None:
+            self._since = t
+            # Jarak ke sampel sebelumnya = ketidakpastian waktu tepi
+            self._since_gap = t - previous_t
+        if t - self._since < self.min_width:
+            return
+
+        started, self._since = self._since, None
+        self.state = active
+        if active:
+            # Awal closure yang terlihat, dipakai saat closure selesai
+            self._active_since = started
+            self.last_pulse = t
+            self.count += 1
+            self._window_count += 1
+            if self.on_pulse is not None:
+                self.on_pulse(1)
+        elif self._active_since is not None:
+            # Tepi turun terjadi setelah sampel sebelum started, jadi lebar
+            # sebenarnya minimal selisih dikurangi jarak sampel tersebut
+            width = started - self._active_since - self._since_gap
+            self._active_since = None
+            if width > 0:
+                self.widths.append(width)
+                self.closure_width = max(self.widths) * WIDTH_SAFETY
+
+    def required_interval(self, now):
+        """
+        Periode sampling paling lambat yang menjamin closure selebar
+        closure_width tetap terhitung. Saat kering (tidak ada pulse selama
+        dry_after, dihitung dari sampel pertama jika belum pernah ada pulse)
+        cukup DRY_SAMPLES sampel per closure.
+        """
+        width = self.closure_width
+        last = self.last_pulse if self.last_pulse is not None else self._first_t
+        dry = last is not None and now - last >= self.dry_after
+        samples = DRY_SAMPLES if dry else self.samples
+        # Debounce butuh min_width + satu periode untuk menerima level aktif
+        return min(width / samples, width - self.min_width)
+
+    def reading(self):
+        """Frekuensi pulse sejak pembacaan terakhir, dikali per_pulse"""
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        pulses = self._window_count
+        self._window_count = 0
+        self._window_start = now
+
+        hz = pulses / elapsed if elapsed > 0 else 0.0
+        return round(hz * self.per_pulse, 3), {"pulses": pulses, "hz": round(hz, 3)}
+
+
+class PulseWindow:
+    """
+    Ring buffer ukuran tetap berisi timestamp pulse (monotonic) untuk
+    jumlah pulse bergulir di beberapa jendela waktu sekaligus. Tiap jendela
+    punya pointer ekor yang hanya maju, jadi query O(1) amortized.
+    """
+
+    def __init__(self, capacity, windows=(60.0, 600.0, 3600.0)):
+        self.capacity = capacity
+        self.times = [0.0] * capacity
+        self.head = 0  # jumlah pulse yang pernah masuk (indeks absolut)
+        self.windows = windows
+        self.tails = [0] * len(windows)
+
+    def add(self, t, pulses=1):
+        for _ in range(min(pulses, self.capacity)):
+            self.times[self.head % self.capacity] = t
+            self.head += 1
+
+    def counts(self, now):
+        """Jumlah pulse di tiap jendela (urutan sama dengan windows)"""
+        times = self.times
+        capacity = self.capacity
+        oldest = self.head - capacity
+        result = []
+        for index, window in enumerate(self.windows):
+            limit = now - window
+            tail = max(self.tails[index], oldest)
+            while tail < self.head and times[tail % capacity] < limit:
+                tail += 1
+            self.tails[index] = tail
+            result.append(self.head - tail)
+        return result
+
+
+class PulseBank:
+    """
+    Semua channel pulse di satu modul DI (port + slave). Satu read_bits per
+    poll mengisi semua channel, jadi menambah anemometer di modul yang sama
+    tidak menambah transaksi di bus. DI biasa di modul yang sama (add_input)
+    ikut dibaca dari snapshot bit yang sama, tanpa span sendiri.
+
+    Periode sampling adaptif: bank memakai periode paling lambat yang masih
+    memenuhi required_interval tiap channel (tidak lebih cepat dari
+    interval config, tidak lebih lambat dari max_interval maupun jarak poll
+    yang dijamin). Job scheduler ikut diperbarui. max_gap adalah jarak
+    antar poll minimum yang dijamin PollScheduler; transaksi lain ditunda,
+    dipecah, atau timeout-nya dipotong supaya muat. Tanpa "max_gap_ms" di
+    config, max_gap = closure - min_width (boleh dinaikkan ke batas yang
+    bisa dipenuhi bus, lihat spanplanner.fit_max_gap) dan ikut melebar jika
+    closure terukur lebih lebar.
+    """
+
+    def __init__(self, arbiter, port, slave, functioncode=2):
+        self.arbiter = arbiter
+        self.port = port
+        self.slave = slave
+        self.functioncode = functioncode
+        self.channels = []
+        self.inputs = []  # (key, channel) DI biasa dari snapshot bank
+        self.bits = None  # snapshot DI terakhir, None jika poll terakhir gagal
+        self.bit_count = 0
+        self.interval = None
+        self.base_interval = None  # interval dari config (paling cepat)
+        self.max_interval = None
+        self.max_gap = None
+        self.max_gap_fixed = False  # max_gap_ms diisi di config
+        self.priority = None
+        self.job = None  # PollJob dari PollScheduler.add, diisi pemanggil
+
+        # Statistik sejak stats() terakhir
+        self.polls = 0
+        self.baseline_polls = 0.0  # jumlah poll jika tetap di base_interval
+        self.bus_time = 0.0
+        self._stats_start = time.monotonic()
+
+    @property
+    def name(self):
+        return f"pulse {self.port}#{self.slave}"
+
+    def add(self, channel, sensor):
+        self.channels.append(channel)
+        self.bit_count = max(self.bit_count, channel.channel + 1)
+
+        # Bank disampling mengikuti channel tercepat & paling penting
+        interval = sensor_interval(sensor, default=PULSE_INTERVAL)
+        priority = sensor_priority(sensor, default=PULSE_PRIORITY)
+        pulse = sensor.get("pulse", {})
+        max_interval = (
+            float(pulse.get("max_interval_ms", MAX_PULSE_INTERVAL * 1000)) / 1000.0
+        )
+        if "max_gap_ms" in pulse:
+            max_gap = float(pulse["max_gap_ms"]) / 1000.0
+            self.max_gap_fixed = True
+        else:
+            max_gap = channel.closure - channel.min_width
+        if self.base_interval is None:
+            self.base_interval = interval
+            self.max_interval = max_interval
+            self.max_gap = max_gap
+            self.priority = priority
+        else:
+            self.base_interval = min(self.base_interval, interval)
+            self.max_interval = min(self.max_interval, max_interval)
+            self.max_gap = min(self.max_gap, max_gap)
+            self.priority = min(self.priority, priority)
+        self.max_gap = max(self.max_gap, self.base_interval)
+        self.interval = self.base_interval
+
+    def add_input(self, key, sensor):
+        """DI biasa: tidak mempengaruhi periode bank, cukup ikut dibaca"""
+        self.inputs.append((key, sensor["channel"]))
+        self.bit_count = max(self.bit_count, sensor["channel"] + 1)
+
+    def input_readings(self):
+        """(key, (nilai, detail)) DI biasa dari snapshot terakhir"""
+        bits = self.bits
+        for key, channel in self.inputs:
+            yield key, (bool(bits[channel]) if bits is not None else None, {})
+
+    def adapt(self, now):
+        """Pilih ulang periode sampling dari lebar closure terukur"""
+        gap = self.max_gap
+        if not self.max_gap_fixed:
+            # Closure lebih lebar dari perkiraan: jarak poll boleh melebar
+            gap = max(gap, min(c.closure_width - c.min_width for c in self.channels))
+        interval = min(self.max_interval, gap)
+        for channel in self.channels:
+            interval = min(interval, channel.required_interval(now))
+        interval = max(interval, self.base_interval)
+
+        if interval != self.interval:
+            self.interval = interval
+            if self.job is not None:
+                self.job.interval = interval
+        if self.job is not None:
+            self.job.max_gap = gap
+
+    async def poll(self):
+        started = time.monotonic()
+        try:
+            async with self.arbiter.lock(self.port):
+                bits = await self.arbiter.client(self.port).read_bits(
+                    self.slave, 0, self.bit_count, self.functioncode
+                )
+        except CircuitOpenError:
+            self.bits = None
+            return
+        except Exception as e:
+            print(f"Error baca DI {self.name}: {e}")
+            self.bits = None
+            return
+
+        t = time.monotonic()
+        self.bits = bits
+        self.polls += 1
+        self.baseline_polls += self.interval / self.base_interval
+        self.bus_time += t - started
+        for channel in self.channels:
+            channel.feed(bits[channel.channel], t)
+        self.adapt(t)
+
+    def stats(self):
+        """
+        Periode sampling saat ini, penghematan transaksi & waktu bus dibanding
+        interval config, dan margin no-miss terhadap closure_width. Dihitung
+        sejak panggilan sebelumnya.
+        """
+        now = time.monotonic()
+        elapsed = now - self._stats_start
+        baseline = self.baseline_polls
+        saved = baseline - self.polls
+        per_poll = self.bus_time / self.polls if self.polls else 0.0
+
+        widths = [c.closure_width for c in self.channels if c.closure_width]
+        closure = min(widths) if widths else None
+        summary = {
+            "interval_ms": round(self.interval * 1000, 1),
+            "base_interval_ms": round(self.base_interval * 1000, 1),
+            "polls": self.polls,
+            "saved_polls": round(saved),
+            "saved_pct": round(100 * saved / baseline, 1) if baseline else 0.0,
+            "saved_bus_ms_per_s": (
+                round(saved * per_poll / elapsed * 1000, 1) if elapsed else 0.0
+            ),
+            "closure_ms": round(closure * 1000, 1) if closure else None,
+            # Sampel per closure tersempit & sisa lebar di atas syarat debounce
+            "samples_per_closure": (
+                round(closure / self.interval, 1) if closure else None
+            ),
+            "margin_ms": (
+                round(
+                    (closure - min(c.min_width for c in self.channels) - self.interval)
+                    * 1000,
+                    1,
+                )
+                if closure
+                else None
+            ),
+        }
+
+        self.polls = 0
+        self.baseline_polls = 0.0
+        self.bus_time = 0.0
+        self._stats_start = now
+        return summary
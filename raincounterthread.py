@@ -1,16 +1,73 @@
-import threading
 import time
-import json
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from datetime import time as dtime
 from zoneinfo import ZoneInfo
 
+from pulsecounter import PulseChannel, PulseWindow
+from rainlog import RainLog
+
 TZ = ZoneInfo("Asia/Makassar")
 
 
-class RainCounterThread(threading.Thread):
+COUNTER_INTERVAL = 5.0  # interval baca register counter (detik)
+BOOKKEEPING_INTERVAL = 1.0  # interval reset jam/hari di mode edge (detik)
+HOURLY_RESET_MINUTE = 5  # reset per jam dilakukan di menit ke-5 jam baru
+RAIN_WINDOWS = (60.0, 600.0, 3600.0)  # jendela curah hujan bergulir (detik)
+RESYNC_INTERVAL = 60.0  # batas dihitung ulang dari jam dinding tiap menit
+
+
+class RolloverClock:
+    """
+    Batas reset jam & hari berikutnya disimpan sebagai waktu monotonic,
+    jadi pengecekan rutin cukup satu perbandingan float (deadline) tanpa
+    membuat datetime. Deadline paling lambat RESYNC_INTERVAL, sehingga
+    lompatan jam dinding (NTP setelah boot tanpa RTC) terkoreksi dalam
+    satu menit.
+    """
+
+    def __init__(self, tz=TZ, reset_minute=HOURLY_RESET_MINUTE):
+        self.tz = tz
+        self.reset_minute = reset_minute
+        self.next_day = 0.0
+        self.next_hour = 0.0
+        self.deadline = 0.0
+
+    def now(self):
+        return datetime.fromtimestamp(time.time(), self.tz)
+
+    def plan(self, last_day, last_hour):
+        """Hitung batas berikutnya dari hari & jam yang terakhir dicatat"""
+        wall = time.time()
+        mono = time.monotonic()
+        now = datetime.fromtimestamp(wall, self.tz)
+
+        if now.day != last_day:
+            next_day = now  # sudah lewat tengah malam, reset sekarang
+        else:
+            tomorrow = now.date() + timedelta(days=1)
+            next_day = datetime.combine(tomorrow, dtime.min, tzinfo=self.tz)
+
+        next_hour = now.replace(minute=self.reset_minute, second=0, microsecond=0)
+        if now.hour == last_hour:
+            next_hour += timedelta(hours=1)
+
+        self.next_day = mono + (next_day.timestamp() - wall)
+        self.next_hour = mono + (next_hour.timestamp() - wall)
+        self.deadline = min(self.next_day, self.next_hour, mono + RESYNC_INTERVAL)
+
+
+class RainCounter:
     """
-    Thread penghitung curah hujan berbasis sensor tipping bucket (reed switch).
+    Penghitung curah hujan berbasis sensor tipping bucket (reed switch).
     Kompatibel dengan Wellpro WP9038ADAM (input aktif LOW).
+    Dipoll sebagai job prioritas tinggi oleh PollScheduler di bus DI-nya.
+
+    Dua mode:
+    - "edge": channel DI disampling oleh PulseBank (satu read_bits untuk
+      semua channel pulse di modul) dan tiap pulse diteruskan ke sini.
+    - "counter": jika sensor punya konfigurasi "counter", register pulse
+      counter milik modul DI dibaca dengan interval lambat dan selisihnya
+      dihitung sendiri (termasuk counter wrap dan counter yang reset).
     """
 
     def __init__(
@@ -20,164 +77,214 @@ class RainCounterThread(threading.Thread):
         port,
         save_path="/home/ftp/modbus/rain_counter.json",
         mm_per_pulse=0.2,  # resolusi sensor (0.5 mm/pulse)
-        realtime_interval=5,  # interval realtime (detik)
-        polling_ms=20,  # polling cepat (20 ms)
-        debounce_ms=20,  # waktu debounce (20 ms)
+        realtime_interval=5,  # interval cek intensitas maksimum (detik)
         max_mm_per_min=8.0,  # batas intensitas maksimum sensor
     ):
-        super().__init__(daemon=True)
         self.modbusampere = modbusampere
         self.sensor = sensor
         self.port = port
         self.mm_per_pulse = mm_per_pulse
         self.save_path = save_path
         self.realtime_interval = realtime_interval
-        self.polling_s = polling_ms / 1000.0
-        self.debounce_s = debounce_ms / 1000.0
+
+        # Mode counter hardware: {"register", "functioncode", "width", "interval"}
+        self.counter = sensor.get("counter")
+        self.mode = "counter" if self.counter else "edge"
+        self.last_counter = None
+        self.last_counter_time = None
+        if self.counter:
+            self.channel = None
+            self.polling_s = float(self.counter.get("interval", COUNTER_INTERVAL))
+            self.counter_modulus = 1 << int(self.counter.get("width", 16))
+        else:
+            # Diisi PulseBank; job poll() hanya mengurus reset jam/hari
+            self.channel = PulseChannel.from_sensor(sensor, on_pulse=self.add_pulses)
+            self.polling_s = BOOKKEEPING_INTERVAL
 
         # batas intensitas
+        self.max_mm_per_min = max_mm_per_min
         self.pulses_per_min_max = max_mm_per_min / mm_per_pulse
 
+        # Timestamp pulse untuk curah hujan 1/10/60 menit terakhir; kapasitas
+        # cukup untuk 1 jam pada 2x intensitas maksimum
+        capacity = max(64, int(2 * self.pulses_per_min_max * 60))
+        self.window = PulseWindow(capacity, RAIN_WINDOWS)
+
         # Counter
         self.running = True
         self.total_count = 0
         self.daily_count = 0
-        self.realtime_count = 0
         self.hourly_count = 0
 
         # Tracking waktu
         now = datetime.now(TZ)
-        self.last_state = False
         self.last_day = now.day
         self.last_hour = now.hour
-        self.last_realtime = time.time()
+        self.last_realtime = time.monotonic()
 
-        # Load data sebelumnya
+        # Load data sebelumnya (snapshot + replay log), lalu mulai writer
+        self.log = RainLog(save_path)
         self.load_count()
+        self.log.start()
+
+        self.clock = RolloverClock()
+        self.clock.plan(self.last_day, self.last_hour)
 
     # ============================================================
     # Helper
     # ============================================================
     def load_count(self):
         try:
-            with open(self.save_path, "r") as f:
-                data = json.load(f)
-                self.total_count = int(data.get("total", 0))
-                self.daily_count = int(data.get("daily_count", 0))
-                self.hourly_count = int(data.get("hourly_count", 0))
-                self.last_hour = data.get("hour", self.last_hour)
-        except Exception:
-            pass
+            data = self.log.load()
+            if data is None:
+                return
+            self.total_count = int(data.get("total", 0))
+            self.daily_count = int(data.get("daily_count", 0))
+            self.hourly_count = int(data.get("hourly_count", 0))
+            self.last_hour = data.get("hour", self.last_hour)
+            self.last_day = data.get("day", self.last_day)
+            self.last_counter = data.get("counter_raw")
+        except Exception as e:
+            print(f"[RainCounter] Error loading rain count: {e}")
 
     def save_count(self):
-        try:
-            with open(self.save_path, "w") as f:
-                json.dump(
-                    {
-                        "total": self.total_count,
-                        "daily_count": self.daily_count,
-                        "daily_mm": round(self.daily_count * self.mm_per_pulse, 2),
-                        "hourly_count": self.hourly_count,
-                        "hourly_mm": round(self.hourly_count * self.mm_per_pulse, 2),
-                        "hour": self.last_hour,
-                        "updated": datetime.now(TZ).isoformat(),
-                    },
-                    f,
-                    indent=2,
-                )
-        except Exception as e:
-            print(f"[RainCounter] Error saving rain count: {e}")
+        # Hanya mengantrikan state; disk diurus thread RainLog
+        self.log.append(
+            {
+                "total": self.total_count,
+                "daily_count": self.daily_count,
+                "daily_mm": round(self.daily_count * self.mm_per_pulse, 2),
+                "hourly_count": self.hourly_count,
+                "hourly_mm": round(self.hourly_count * self.mm_per_pulse, 2),
+                "hour": self.last_hour,
+                "day": self.last_day,
+                "counter_raw": self.last_counter,
+                "updated": datetime.now(TZ).isoformat(),
+            }
+        )
 
     # ============================================================
-    # Main Thread
+    # Polling (dipanggil PollScheduler tiap polling_s)
     # ============================================================
-    def run(self):
-        print("[RainCounter] Thread started. (active LOW, 0.5 mm/pulse)")
-
-        while self.running:
-            now = datetime.now(TZ)
-            t = time.time()
-
-            # Reset harian setiap tengah malam
-            if now.day != self.last_day:
-                self.daily_count = 0
-                self.hourly_count = 0
-                self.last_day = now.day
-                self.last_hour = now.hour
-                self.save_count()
-                print("[RainCounter] Reset daily rainfall.")
-
-            # Reset saat masuk jam baru
-            if now.hour != self.last_hour and now.minute >= 5:
-                print(
-                    f"[RainCounter] Hourly reset. Previous hour total: "
-                    f"{self.hourly_count * self.mm_per_pulse:.2f} mm"
-                )
-                self.hourly_count = 0
-                self.last_hour = now.hour
-                self.save_count()
+    async def poll(self):
+        if not self.running:
+            return
+
+        t = time.monotonic()
+        if t >= self.clock.deadline:
+            self.rollover()
 
+        if self.mode == "counter":
             try:
-                raw_state = self.modbusampere.read_digital_inputs(
-                    self.sensor, self.port
+                await self.poll_counter()
+            except Exception as e:
+                print(f"[RainCounter] Read error: {e}")
+
+        # Cek intensitas 1 menit terakhir terhadap batas sensor
+        if t - self.last_realtime >= self.realtime_interval:
+            mm_per_min = self.rainfall_realtime
+            if mm_per_min > self.max_mm_per_min:
+                print(
+                    f"[RainCounter][WARN] Intensity too high: "
+                    f"{mm_per_min:.2f} mm/min (allowed ≤ {self.max_mm_per_min:g} mm/min)"
                 )
+            self.last_realtime = t
 
-                if raw_state is not None:
-                    # Aktif LOW → invert hasil bacaan
-                    state = not raw_state
-
-                    # Deteksi rising edge (OFF → ON / 1 pulse)
-                    if state and not self.last_state:
-                        # Debounce cepat
-                        time.sleep(self.debounce_s)
-                        confirm = not self.modbusampere.read_digital_inputs(
-                            self.sensor, self.port
-                        )
-
-                        if confirm:
-                            self.total_count += 1
-                            self.daily_count += 1
-                            self.realtime_count += 1
-                            self.hourly_count += 1
-                            self.save_count()
-                            print(
-                                f"[RainCounter] Pulse detected. total={self.total_count}"
-                            )
-
-                    self.last_state = state
+    def rollover(self):
+        """Reset harian/per jam; dipanggil saat deadline RolloverClock lewat"""
+        now = self.clock.now()
 
-            except Exception as e:
-                print(f"[RainCounter] Read error: {e}")
+        # Reset harian setiap tengah malam
+        if now.day != self.last_day:
+            self.daily_count = 0
+            self.hourly_count = 0
+            self.last_day = now.day
+            self.last_hour = now.hour
+            self.save_count()
+            print("[RainCounter] Reset daily rainfall.")
+
+        # Reset saat masuk jam baru
+        if now.hour != self.last_hour and now.minute >= self.clock.reset_minute:
+            print(
+                f"[RainCounter] Hourly reset. Previous hour total: "
+                f"{self.hourly_count * self.mm_per_pulse:.2f} mm"
+            )
+            self.hourly_count = 0
+            self.last_hour = now.hour
+            self.save_count()
+
+        self.clock.plan(self.last_day, self.last_hour)
+
+    def add_pulses(self, pulses):
+        self.total_count += pulses
+        self.daily_count += pulses
+        self.window.add(time.monotonic(), pulses)
+        self.hourly_count += pulses
+        self.save_count()
+        print(f"[RainCounter] Pulse detected (+{pulses}). total={self.total_count}")
 
-            # Interval realtime reset
-            if t - self.last_realtime >= self.realtime_interval:
-                mm_interval = self.realtime_count * self.mm_per_pulse
-                mm_per_min_equiv = (mm_interval / self.realtime_interval) * 60.0
+    async def poll_counter(self):
+        raw = await self.modbusampere.read_counter(self.sensor, self.port)
+        if raw is None:
+            return
 
-                if mm_per_min_equiv > 8.0:
-                    print(
-                        f"[RainCounter][WARN] Intensity too high: "
-                        f"{mm_per_min_equiv:.2f} mm/min (allowed ≤ 8 mm/min)"
-                    )
+        t = time.monotonic()
+        previous, previous_time = self.last_counter, self.last_counter_time
+        self.last_counter, self.last_counter_time = raw, t
+        if previous is None:
+            # Baseline pertama, belum ada selisih
+            self.save_count()
+            return
 
-                # Reset untuk interval berikutnya
-                self.realtime_count = 0
-                self.last_realtime = t
+        # Batas wajar kenaikan sejak bacaan terakhir (2x intensitas maksimum).
+        # Setelah restart gateway waktu bacaan lama tidak diketahui.
+        if previous_time is None:
+            limit = None
+        else:
+            limit = 2 * self.pulses_per_min_max * (t - previous_time) / 60.0 + 2
 
-            time.sleep(self.polling_s)
+        delta = (raw - previous) % self.counter_modulus
+        if raw < previous and (limit is None or delta > limit):
+            # Bukan wrap dari dekat batas atas: counter modul reset ke 0
+            print(f"[RainCounter] Counter reset terdeteksi ({previous} → {raw})")
+            delta = raw
+        if limit is not None and delta > limit:
+            print(
+                f"[RainCounter][WARN] Lonjakan counter {previous} → {raw} "
+                f"diabaikan (maks {limit:.0f} pulse)"
+            )
+            delta = 0
+
+        if delta:
+            self.add_pulses(delta)
+        elif raw != previous:
+            self.save_count()
 
     # ============================================================
-    # Stop Thread
+    # Stop
     # ============================================================
     def stop(self):
         self.running = False
+        self.log.close()
 
     # ============================================================
     # Property hasil
     # ============================================================
     @property
     def rainfall_realtime(self):
-        return round(self.realtime_count * self.mm_per_pulse, 3)
+        """Curah hujan 1 menit terakhir (mm), bergulir"""
+        return self.rainfall_rolling()["last_1m"]
+
+    def rainfall_rolling(self):
+        """Curah hujan 1/10/60 menit terakhir (mm) dan intensitas (mm/jam)"""
+        last_1m, last_10m, last_60m = self.window.counts(time.monotonic())
+        return {
+            "last_1m": round(last_1m * self.mm_per_pulse, 3),
+            "last_10m": round(last_10m * self.mm_per_pulse, 3),
+            "last_60m": round(last_60m * self.mm_per_pulse, 3),
+            # Intensitas dari jendela 10 menit, dinyatakan per jam
+            "intensity_mm_h": round(last_10m * self.mm_per_pulse * 6, 2),
+        }
 
     @property
     def rainfall_hourly(self):
@@ -190,3 +297,38 @@ class RainCounterThread(threading.Thread):
     @property
     def rainfall_total(self):
         return round(self.total_count * self.mm_per_pulse, 2)
+
+
+if __name__ == "__main__":
+    # Benchmark pengecekan reset jam/hari: python raincounterthread.py
+    N = 200000
+    now = datetime.now(TZ)
+    last_day, last_hour = now.day, now.hour
+
+    def check_datetime():
+        now = datetime.now(TZ)
+        time.time()
+        return now.day != last_day or (now.hour != last_hour and now.minute >= 5)
+
+    clock = RolloverClock()
+    clock.plan(last_day, last_hour)
+
+    def check_monotonic():
+        return time.monotonic() >= clock.deadline
+
+    for label, check in (
+        ("datetime.now(TZ)", check_datetime),
+        ("RolloverClock", check_monotonic),
+    ):
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        for _ in range(N):
+            check()
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        # Beban CPU kalau dicek tiap 20 ms (laju polling DI lama)
+        cpu_percent = cpu / N / 0.02 * 100
+        print(
+            f"{label:<18} {N / elapsed:>12,.0f} iterasi/s, "
+            f"CPU {cpu_percent:.4f}% pada polling 20 ms"
+        )
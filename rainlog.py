@@ -0,0 +1,186 @@
+import json
+import os
+import queue
+import threading
+import time
+
+FSYNC_INTERVAL = 1.0  # jeda maksimum sebelum record di-fsync (detik)
+COMPACT_RECORDS = 500  # compaction setelah sekian record di log
+COMPACT_INTERVAL = 3600.0  # atau paling lambat tiap jam
+
+
+class RainLog:
+    """
+    Penyimpanan state rain counter: snapshot JSON + log append-only.
+
+    Tiap perubahan state ditulis sebagai satu baris JSON (state lengkap +
+    nomor urut) oleh thread writer, jadi loop polling tidak pernah menunggu
+    disk. fsync dikumpulkan per FSYNC_INTERVAL. Secara berkala state
+    terakhir ditulis ke snapshot (atomic replace) lalu log dikosongkan.
+    Saat start, snapshot dibaca lalu sisa log di-replay; baris terakhir
+    yang terpotong karena mati listrik diabaikan.
+    """
+
+    def __init__(
+        self,
+        snapshot_path,
+        fsync_interval=FSYNC_INTERVAL,
+        compact_records=COMPACT_RECORDS,
+        compact_interval=COMPACT_INTERVAL,
+    ):
+        self.snapshot_path = snapshot_path
+        self.log_path = snapshot_path + ".log"
+        self.fsync_interval = fsync_interval
+        self.compact_records = compact_records
+        self.compact_interval = compact_interval
+
+        self.queue = queue.Queue()
+        self.seq = 0
+        self.log_records = 0
+        self.thread = None
+
+    def load(self):
+        """State terakhir dari snapshot + replay log, None jika belum ada"""
+        state = None
+        try:
+            with open(self.snapshot_path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[RainLog] Snapshot tidak terbaca: {e}")
+        seq = state.get("seq", 0) if state else 0
+
+        replayed = 0
+        try:
+            with open(self.log_path, "r+b") as f:
+                good = 0
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Baris terpotong saat crash: buang supaya record
+                        # berikutnya tidak tersambung ke sisa baris ini
+                        f.truncate(good)
+                        break
+                    good += len(line)
+                    self.log_records += 1
+                    if record.get("seq", 0) > seq:
+                        state = record
+                        seq = record["seq"]
+                        replayed += 1
+        except FileNotFoundError:
+            pass
+        if replayed:
+            print(f"[RainLog] {replayed} record di-replay dari {self.log_path}")
+
+        self.seq = seq
+        return state
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="RainLog", daemon=True)
+        self.thread.start()
+
+    def append(self, state):
+        """Antrikan state baru, tidak menyentuh disk"""
+        self.seq += 1
+        self.queue.put_nowait(dict(state, seq=self.seq))
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+        self.thread = None
+
+    def _write_snapshot(self, state):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _run(self):
+        log = None
+        broken = False  # tulis gagal: log mungkin berisi baris terpotong
+        last_sync = last_compact = time.monotonic()
+        latest = None
+        newest = None  # record terbaru yang diterima, tertulis atau belum
+        pending = []
+        dirty = False
+        stopping = False
+
+        while not stopping:
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=self.fsync_interval))
+                while True:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            for record in batch:
+                if record is None:
+                    stopping = True
+                else:
+                    pending.append(record)
+                    newest = record
+
+            try:
+                if log is None:
+                    mode = "a"
+                    if broken and newest is not None:
+                        # Ganti log yang mungkin rusak dengan snapshot baru
+                        self._write_snapshot(newest)
+                        mode = "w"
+                        pending = []
+                        latest = None
+                        self.log_records = 0
+                    log = open(self.log_path, mode)
+                    broken = False
+
+                for record in pending:
+                    log.write(json.dumps(record) + "\n")
+                    self.log_records += 1
+                    latest = record
+                    dirty = True
+                pending = []
+
+                now = time.monotonic()
+                if dirty and (stopping or now - last_sync >= self.fsync_interval):
+                    log.flush()
+                    os.fsync(log.fileno())
+                    dirty = False
+                    last_sync = now
+
+                # Snapshot ditulis dulu, baru log dikosongkan: crash di
+                # antaranya hanya menyisakan record lama yang seq-nya kalah
+                if latest is not None and (
+                    stopping
+                    or self.log_records >= self.compact_records
+                    or now - last_compact >= self.compact_interval
+                ):
+                    self._write_snapshot(latest)
+                    log.close()
+                    log = None
+                    log = open(self.log_path, "w")
+                    self.log_records = 0
+                    latest = None
+                    last_compact = now
+            except Exception as e:
+                # Thread tetap hidup; tiap record berisi state lengkap jadi
+                # cukup yang terbaru dicoba lagi di putaran berikutnya
+                print(f"[RainLog] Error menulis state: {e}")
+                pending = [newest] if newest is not None else []
+                broken = True
+                dirty = False
+                if log is not None:
+                    try:
+                        log.close()
+                    except Exception:
+                        pass
+                    log = None
+
+        if log is not None:
+            log.close()
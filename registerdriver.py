@@ -0,0 +1,153 @@
+import struct
+import time
+from operator import mul
+
+# Tipe register di config ("conversion.register_type") -> format struct dan
+# jumlah register. Nilai 32 bit: word tinggi di register pertama (big endian).
+REGISTER_FORMATS = {
+    "16bit_int": ("h", 1),
+    "16bit_uint": ("H", 1),
+    "32bit_int": ("i", 2),
+    "32bit_uint": ("I", 2),
+    "32bit_float": ("f", 2),
+}
+DEFAULT_REGISTER_TYPE = "16bit_int"
+
+
+def sensor_format(sensor):
+    """(format struct, jumlah register, skala) sensor register-mapped"""
+    conversion = sensor.get("conversion", {})
+    register_type = conversion.get("register_type", DEFAULT_REGISTER_TYPE)
+    if register_type not in REGISTER_FORMATS:
+        raise ValueError(
+            f"register_type '{register_type}' sensor {sensor['name']} tidak dikenal "
+            f"(pilihan: {', '.join(REGISTER_FORMATS)})"
+        )
+    fmt, width = REGISTER_FORMATS[register_type]
+    return fmt, width, float(conversion.get("scaling_factor", 1))
+
+
+class DecodePlan:
+    """
+    Rencana decode satu span register yang dikompilasi saat config dimuat:
+    satu struct.Struct untuk seluruh data span (register yang tidak dipakai
+    jadi pad byte), plus tuple skala dan key hasil. Tiap baca cukup satu
+    unpack_from langsung dari buffer respons lalu dikali skala.
+    """
+
+    def __init__(self, span, hold_zero=False):
+        entries = []
+        for key, device, sensor, offset in span.entries:
+            fmt, width, scale = sensor_format(sensor)
+            entries.append((offset, fmt, width, scale, key))
+        entries.sort(key=lambda entry: entry[0])
+
+        # Sensor yang register-nya tumpang tindih tidak bisa dalam satu
+        # format berurutan; dipecah jadi satu Struct per sensor
+        overlapping = any(
+            entries[i][0] < entries[i - 1][0] + entries[i - 1][2]
+            for i in range(1, len(entries))
+        )
+        if overlapping:
+            self.structs = tuple(
+                (struct.Struct(">" + fmt), 3 + 2 * offset)
+                for offset, fmt, _, _, _ in entries
+            )
+            self.struct = None
+        else:
+            layout = ">"
+            position = 0
+            for offset, fmt, width, _, _ in entries:
+                if offset > position:
+                    layout += f"{2 * (offset - position)}x"
+                layout += fmt
+                position = offset + width
+            self.struct = struct.Struct(layout)
+            self.structs = None
+
+        self.keys = tuple(entry[4] for entry in entries)
+        self.scales = tuple(entry[3] for entry in entries)
+        self.hold_zero = hold_zero
+        self.missing = [None] * len(entries)
+        self.last = self.missing
+
+    def __call__(self, frame):
+        """Nilai mentah semua sensor dari frame respons fc 3/4"""
+        if self.struct is not None:
+            return self.struct.unpack_from(frame, 3)
+        return tuple(fmt.unpack_from(frame, offset)[0] for fmt, offset in self.structs)
+
+    def values(self, raw):
+        """
+        Nilai berskala per sensor (urutan self.keys) dari hasil __call__;
+        None semua jika baca gagal (raw None). Dengan hold_zero, nilai 0
+        setelah pernah ada nilai bukan 0 diganti nilai terakhir (0 sebelum
+        itu tetap dilaporkan), dan baca gagal memakai nilai terakhir.
+        """
+        if not self.hold_zero:
+            if raw is None:
+                return self.missing
+            return list(map(mul, raw, self.scales))
+        if raw is not None:
+            self.last = [
+                value * scale if value or last is None else last
+                for value, scale, last in zip(raw, self.scales, self.last)
+            ]
+        return self.last
+
+
+class RegisterDriver:
+    """
+    Driver generik device direct_rs485: semua sensor dibaca dari register
+    sesuai register_address, register_type dan scaling_factor di config,
+    tanpa nama sensor yang di-hardcode. Device bisa minta nilai 0 diabaikan
+    ("hold_zero"); RS-RAD defaultnya begitu karena sesekali membalas 0
+    saat sedang mengukur.
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+    def compile(self, span):
+        device = span.entries[0][1]
+        hold_zero = device.get("hold_zero", "rs_rad" in device["name"].lower())
+        return DecodePlan(span, hold_zero=hold_zero)
+
+
+if __name__ == "__main__":
+    # Benchmark decode span RS-RAD: python registerdriver.py
+    # (kebenaran decode diuji di test_registerdriver.py)
+    from spanplanner import ReadSpan
+
+    sensors = [
+        ("debit", "16bit_int", 0.001, 1002),
+        ("water_height", "16bit_int", 1, 1003),
+        ("Velocity", "16bit_int", 0.01, 1004),
+        ("water_volume", "32bit_int", 1, 1000),
+    ]
+    device = {"name": "rs_rad", "type": "direct_rs485"}
+    span = ReadSpan("/dev/ttyUSB1", 1, 3, 1000)
+    for index, (name, register_type, scale, address) in enumerate(sensors):
+        sensor = {
+            "name": name,
+            "register_address": address,
+            "conversion": {"register_type": register_type, "scaling_factor": scale},
+        }
+        span.add((1, index), device, sensor, address, 2 if "32" in register_type else 1)
+
+    registers = (1, 5, 1500, 2000, 120)
+    frame = bytes([1, 3, 10]) + struct.pack(">5H", *registers) + b"\0\0"
+    plan = RegisterDriver({}).compile(span)
+
+    readings = {}
+
+    def read_plan():
+        for key, value in zip(plan.keys, plan.values(plan(frame))):
+            readings[key] = (value, {})
+
+    N = 100000
+    started = time.perf_counter()
+    for _ in range(N):
+        read_plan()
+    elapsed = time.perf_counter() - started
+    print(f"DecodePlan {N / elapsed:>12,.0f} span/s")
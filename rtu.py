@@ -1,5 +1,5 @@
 # rtu_main.py
-import serial
+import asyncio
 import json
 import time
 import paho.mqtt.client as mqtt
@@ -8,9 +8,18 @@ import sys
 import subprocess
 import requests
 from dotenv import load_dotenv
+from busarbiter import BusArbiter
+from circuitbreaker import CircuitOpenError
 from modbusampere import Modbusampere
 from flowmeter import Flowmeter
-from raincounterthread import RainCounterThread
+from portmanager import PortManager
+from pulsecounter import PulseBank, PulseChannel, bank_for_input, is_pulse_sensor
+from raincounterthread import RainCounter
+from registerdriver import RegisterDriver
+from scheduler import PollScheduler, sensor_priority
+from sensorconfig import ConfigError, compile_config, validate_config
+from spanplanner import chunk_spans, fit_max_gap, gap_windows, plan_spans
+from virtualsensor import VirtualSensors
 from camera_stream import CameraStreamThread
 import tempfile
 import urllib3
@@ -35,11 +44,38 @@ RAINFALL_MM_PERPULSE = float(os.getenv("RAINFALL_MM_PERPULSE", 0.5))
 SSL_CERT_PATH = "/home/pi/raspberry_modbus/telemetry-adaro.id.crt"
 
 CAMERA_MODE = str(os.getenv("CAMERA_MODE", "OFF"))
+PUBLISH_INTERVAL = float(os.getenv("PUBLISH_INTERVAL", 30))
 
 VERSION = "1.1.5"
 
+# Field payload API (selain device_location_id), urut seperti dikirim
+API_FIELDS = (
+    "ph",
+    "tds",
+    "tss",
+    "debit",
+    "rainfall",
+    "rainfall_daily",
+    "water_height",
+    "temperature",
+    "humidity",
+    "wind_direction",
+    "wind_speed",
+    "solar_radiation",
+    "evaporation",
+    "dissolve_oxygen",
+    "velocity",
+    "water_volume",
+)
+
 
 class RTU:
+    # Turunan (mis. MonitorRTU) boleh punya kalibrasi, versi dan nilai
+    # utama rainfall sendiri
+    version = VERSION
+    mm_per_pulse = RAINFALL_MM_PERPULSE
+    rain_value = "realtime"  # key value_details yang jadi "value" rainfall
+
     def __init__(self, config_file):
         self.config = self.load_config(config_file)
         self.report_requested = False
@@ -67,11 +103,15 @@ class RTU:
             self.camera_thread.start()
 
         # Inisialisasi komponen sensor hanya jika bukan CAMERA_ONLY
-        self.ser_ports = self.init_serial_ports()
-        self.modbusampere = Modbusampere(self.ser_ports, self.config)
-        self.flowmeter = Flowmeter(self.ser_ports, self.config)
+        self.ports = PortManager(self.config["serial_ports"]).open()
+        self.arbiter = BusArbiter(
+            self.ports, breaker=self.config.get("circuit_breaker")
+        )
+        self.modbusampere = Modbusampere(self.config, self.arbiter)
+        self.flowmeter = Flowmeter(self.config, self.arbiter)
+        self.registers = RegisterDriver(self.config)
 
-        # === Rain Counter Thread ===
+        # === Rain Counter ===
         rain_sensor = None
         rain_port = None
         for device in self.config["devices"]:
@@ -82,17 +122,30 @@ class RTU:
                         rain_port = device["port"]
                         break
 
-        if rain_sensor:
-            self.rain_thread = RainCounterThread(
+        if rain_sensor and rain_port in self.arbiter.clients:
+            # Interval sensor rainfall = periode sampling reed switch (PulseBank)
+            self.rain_counter = RainCounter(
                 self.modbusampere,
                 rain_sensor,
                 rain_port,
-                mm_per_pulse=RAINFALL_MM_PERPULSE,
+                mm_per_pulse=self.mm_per_pulse,
                 realtime_interval=5,
             )
-            self.rain_thread.start()
         else:
-            self.rain_thread = None
+            self.rain_counter = None
+
+        self.scheduler = self.build_schedule(rain_sensor, rain_port)
+
+        # Config dikompilasi sekali: loop publish tinggal jalan di list Sensor
+        self.sensors = compile_config(self.config, API_FIELDS)
+        self.rain_keys = []
+        if self.rain_counter:
+            for sensor in self.sensors:
+                if sensor.name == "rainfall":
+                    sensor.publish = self.publish_rain
+                    self.rain_keys.append(sensor.key)
+        # Sensor virtual: ekspresi dikompilasi sekali, dihitung tiap publish
+        self.virtual = VirtualSensors(self.config)
 
     def load_config(self, config_file):
         url = CONFIG_URL.format(DEVICE_LOCATION_ID)
@@ -105,29 +158,29 @@ class RTU:
             response = requests.get(url, headers=headers, verify=False, timeout=10)
             response.raise_for_status()
             config = response.json()
+            self.check_config(config)
             print("Berhasil ambil config dari API")
             return config
         except Exception as e:
             print(f"Gagal ambil config API, fallback ke file lokal: {e}")
             try:
                 with open(config_file) as f:
-                    return json.load(f)
+                    config = json.load(f)
+                self.check_config(config)
+                return config
             except Exception as e2:
                 print(f"Gagal load config lokal: {e2}")
                 sys.exit(1)
 
-    def init_serial_ports(self):
-        ports = {}
-        for port, params in self.config["serial_ports"].items():
-            ports[port] = serial.Serial(
-                port=port,
-                baudrate=params["baudrate"],
-                bytesize=params["bytesize"],
-                parity=params["parity"],
-                stopbits=params["stopbits"],
-                timeout=1,
-            )
-        return ports
+    def check_config(self, config):
+        """Validasi config; ConfigError diteruskan ke load_config"""
+        try:
+            warnings = validate_config(config)
+        except ConfigError as e:
+            print(f"❌ Config tidak valid:\n{e}")
+            raise
+        for warning in warnings:
+            print(f"⚠️ Config: {warning}")
 
     def init_mqtt(self):
         conf = self.config["mqtt"]
@@ -157,12 +210,15 @@ class RTU:
             return
 
     def on_message(self, client, userdata, msg):
-        payload = msg.payload.decode().strip().lower()
+        text = msg.payload.decode().strip()
+        payload = text.lower()
         print(f"📨 Command MQTT diterima: '{payload}' dari topic: {msg.topic}")
 
         # Handle command dari topic sensor utama
         if msg.topic == self.config["mqtt"]["command_topic"]:
-            if payload == "report":
+            if text.startswith("{"):
+                self.handle_json_command(text)
+            elif payload == "report":
                 self.report_requested = True
             elif payload == "restart":
                 self.restart_requested = True
@@ -172,6 +228,24 @@ class RTU:
         # Command camera dihandle oleh CameraStreamThread melalui topic terpisah
         # Tidak perlu handle di sini
 
+    def handle_json_command(self, text):
+        """
+        Command JSON di topic command. Saat ini hanya kalibrasi analog:
+          {"calibration": {"sensor": "ph", "points": [[4, 0], [20, 14]]}}
+        "points"/"coefficients" null melepas kalibrasi (kembali ke linear).
+        """
+        try:
+            command = json.loads(text)
+            calibration = dict(command["calibration"])
+            name = calibration.pop("sensor")
+            if calibration.get("points", ...) is None or (
+                calibration.get("coefficients", ...) is None
+            ):
+                calibration = None
+            self.modbusampere.calibrate(name, calibration)
+        except Exception as e:
+            print(f"❌ Command JSON ditolak: {e}")
+
     def send_telemetry(self, payload_api):
         try:
             headers = {
@@ -192,13 +266,246 @@ class RTU:
         except Exception as e:
             print(f"⚠️ Error kirim API: {e}")
 
-    def monitor_all_devices(self):
+    async def show_sensors(self, sensors_payload):
+        """Hook tampilan lokal tiap siklus publish; RTU tanpa layar tidak memakainya"""
+
+    def rain_reading(self):
+        rolling = self.rain_counter.rainfall_rolling()
+        value_details = {
+            "realtime": rolling["last_1m"],
+            "last_10m": rolling["last_10m"],
+            "last_60m": rolling["last_60m"],
+            "intensity_mm_h": rolling["intensity_mm_h"],
+            "daily": self.rain_counter.rainfall_daily,
+            "hourly": self.rain_counter.rainfall_hourly,
+            "total": self.rain_counter.rainfall_total,
+            "unit": "mm",
+        }
+        return self.rain_counter.rainfall_hourly, value_details
+
+    def publish_rain(self, sensor, readings, sensors_payload, payload_api):
+        """Publish sensor rainfall dari RainCounter (pengganti publish_reading)"""
+        value, value_details = readings[sensor.key]
+        sensors_payload.append(
+            {
+                sensor.name: {
+                    "sensor_type": sensor.type,
+                    "unit": sensor.unit,
+                    "value": round(value_details[self.rain_value], 1)
+                    if value_details[self.rain_value] is not None
+                    else "ERROR",
+                    "status": "OK" if value is not None else "error",
+                    "values": value_details,
+                }
+            }
+        )
+        if value is not None and sensor.api_field is not None:
+            payload_api[sensor.api_field] = round(value, 1)
+            payload_api["rainfall_daily"] = round(self.rain_counter.rainfall_daily, 1)
+
+    def driver_for(self, device):
+        if device["type"] == "modbus":
+            return self.modbusampere
+        elif device["type"] == "direct_rs485":
+            return self.registers
+        return None
+
+    def build_schedule(self, rain_sensor, rain_port):
+        """
+        Rencanakan span baca dari config (lihat spanplanner) lalu buat satu
+        job polling per span. Hasil terakhir tiap sensor disimpan di
+        self.readings untuk dipublish.
+        """
+        scheduler = PollScheduler()
+        self.readings = {}
+        self.bus_stats = {"bus_reads": 0, "saved_reads": 0}
+        self.device_stats = {}
+
+        # Device di port yang tidak terbuka tidak dijadwalkan sama sekali;
+        # tanpa client tiap baca hanya akan gagal dengan KeyError
+        for device in self.config["devices"]:
+            if device["port"] not in self.arbiter.clients:
+                print(
+                    f"⚠️ Port {device['port']} tidak terbuka, "
+                    f"device {device['name']} tidak dipoll"
+                )
+
+        # Satu PulseBank per modul DI: satu read_bits untuk semua channel pulse
+        self.pulse_banks = {}
+        self.pulse_channels = {}
+        for d_idx, device in enumerate(self.config["devices"]):
+            if self.driver_for(device) is not self.modbusampere:
+                continue
+            if device["port"] not in self.arbiter.clients:
+                continue
+            for s_idx, sensor in enumerate(device["sensors"]):
+                if not is_pulse_sensor(sensor):
+                    continue
+                if sensor is rain_sensor:
+                    channel = self.rain_counter.channel
+                else:
+                    channel = PulseChannel.from_sensor(sensor)
+                    self.pulse_channels[(d_idx, s_idx)] = channel
+                group = (device["port"], sensor["slave_address"])
+                bank = self.pulse_banks.get(group)
+                if bank is None:
+                    bank = self.pulse_banks[group] = PulseBank(self.arbiter, *group)
+                bank.add(channel, sensor)
+
+        # DI biasa di modul yang sudah punya PulseBank dibaca dari snapshot
+        # bank: satu read_bits per poll, tanpa span fc2 tersendiri
+        bank_inputs = set()
+        for d_idx, device in enumerate(self.config["devices"]):
+            if self.driver_for(device) is not self.modbusampere:
+                continue
+            for s_idx, sensor in enumerate(device["sensors"]):
+                if sensor is rain_sensor:
+                    continue
+                bank = bank_for_input(self.pulse_banks, device, sensor)
+                if bank is not None:
+                    bank.add_input((d_idx, s_idx), sensor)
+                    bank_inputs.add(id(sensor))
+
+        # Rainfall, input pulse lain & DI biasa di modulnya disampling
+        # PulseBank, bukan lewat span
+        spans = plan_spans(
+            self.config,
+            skip=lambda device, sensor: sensor is rain_sensor
+            or is_pulse_sensor(sensor)
+            or id(sensor) in bank_inputs
+            or self.driver_for(device) is None
+            or device["port"] not in self.arbiter.clients,
+        )
+
+        # Di bus yang ada input pulse, max_gap disesuaikan dengan baudrate
+        # lalu span dipecah supaya satu transaksi muat di sela max_gap
+        # dikurangi lama poll PulseBank itu sendiri
+        serial_ports = self.config.get("serial_ports", {})
+        fit_max_gap(self.pulse_banks.values(), spans, serial_ports)
+        max_time = gap_windows(self.pulse_banks.values(), serial_ports)
+        self.spans = chunk_spans(spans, max_time, serial_ports)
+        for span in self.spans:
+            # Decode/konversi span dikompilasi sekali di sini (DecodePlan untuk
+            # device register-mapped, AnalogPlan untuk analog Wellpro)
+            device = span.entries[0][1]
+            span.plan = self.driver_for(device).compile(span)
+            span.device = f"{device['name']} {span.port}#{span.slave}"
+            scheduler.add(
+                span.port,
+                span.name,
+                span.interval,
+                span.priority,
+                lambda span=span: self.poll_span(span),
+                budget=lambda span=span: self.arbiter.span_budget(span),
+            )
+
+        for bank in self.pulse_banks.values():
+            # Job disimpan di bank supaya periode adaptifnya bisa diubah
+            bank.job = scheduler.add(
+                bank.port,
+                bank.name,
+                bank.interval,
+                bank.priority,
+                bank.poll,
+                max_gap=bank.max_gap,
+            )
+
+        if self.rain_counter:
+            scheduler.add(
+                rain_port,
+                "rain_counter",
+                self.rain_counter.polling_s,
+                sensor_priority(rain_sensor, default=0),
+                self.rain_counter.poll,
+            )
+        return scheduler
+
+    async def poll_span(self, span):
+        started = time.monotonic()
+        error = None
+        try:
+            # Di bus dengan input pulse timeout dipotong sebelum poll berikutnya
+            values = await self.arbiter.read_span(
+                span, self.scheduler.window(span.port)
+            )
+        except CircuitOpenError:
+            values = None
+        except Exception as e:
+            values = None
+            error = e
+        self.record_device(span.device, time.monotonic() - started, values is None)
+
+        self.bus_stats["bus_reads"] += 1
+        self.bus_stats["saved_reads"] += len(span.entries) - 1
+        plan = span.plan
+        if plan is not None:
+            for key, value in zip(plan.keys, plan.values(values)):
+                self.readings[key] = (value, {})
+        else:
+            for key, device, sensor, offset in span.entries:
+                try:
+                    value = self.driver_for(device).decode(sensor, values, offset)
+                except Exception as e:
+                    print(f"Error decode {sensor['name']}: {e}")
+                    value = None
+                self.readings[key] = (value, {})
+
+        # Baca gagal diteruskan ke PollScheduler supaya tercatat di statistik
+        # error job (pesan dicetak scheduler)
+        if error is not None:
+            raise error
+
+    def record_device(self, device, elapsed, failed):
+        """Latency baca per device (port#slave) untuk siklus publish ini"""
+        stats = self.device_stats.get(device)
+        if stats is None:
+            stats = self.device_stats[device] = {
+                "reads": 0,
+                "errors": 0,
+                "total": 0.0,
+                "max": 0.0,
+            }
+        stats["reads"] += 1
+        stats["errors"] += failed
+        stats["total"] += elapsed
+        stats["max"] = max(stats["max"], elapsed)
+
+    def device_latency(self):
+        """Ringkasan latency per device lalu reset"""
+        summary = {}
+        for device, stats in self.device_stats.items():
+            summary[device] = {
+                "reads": stats["reads"],
+                "errors": stats["errors"],
+                "avg_ms": round(stats["total"] / stats["reads"] * 1000, 1),
+                "max_ms": round(stats["max"] * 1000, 1),
+            }
+        self.device_stats = {}
+        return summary
+
+    async def run(self):
+        """Jalankan RTU: semua akses bus berjalan di satu event loop"""
+        if CAMERA_MODE != "CAMERA_ONLY":
+            self.arbiter.open()
+            await self.flowmeter.setup()
+            self.scheduler.start()
+            # Publish pertama menunggu semua sensor terbaca sekali
+            try:
+                await asyncio.wait_for(
+                    self.scheduler.first_round.wait(), PUBLISH_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                print("⚠️ Belum semua sensor terbaca, tetap publish")
+        await self.monitor_all_devices()
+
+    async def monitor_all_devices(self):
         try:
             while not self.restart_requested:
                 if self.update_requested:
                     try:
                         print("Menjalankan git pull origin master...")
-                        result = subprocess.run(
+                        result = await asyncio.to_thread(
+                            subprocess.run,
                             ["git", "pull", "origin", "master"],
                             capture_output=True,
                             text=True,
@@ -228,7 +535,7 @@ class RTU:
 
                 # Jika CAMERA_ONLY, skip pembacaan sensor
                 if CAMERA_MODE == "CAMERA_ONLY":
-                    time.sleep(5)
+                    await asyncio.sleep(5)
                     continue
 
                 # Lanjutkan dengan pembacaan sensor untuk mode lainnya
@@ -239,110 +546,86 @@ class RTU:
                     ),
                     "device_location_id": DEVICE_LOCATION_ID,
                     "sensors": [],
-                    "version": VERSION,
+                    "version": self.version,
                 }
 
                 payload_api = {
                     "device_location_id": DEVICE_LOCATION_ID,
-                    "ph": 0.0,
-                    "tds": 0.0,
-                    "tss": 0.0,
-                    "debit": 0.0,
-                    "rainfall": 0.0,
-                    "rainfall_daily": 0.0,
-                    "water_height": 0.0,
-                    "temperature": 0.0,
-                    "humidity": 0.0,
-                    "wind_direction": 0.0,
-                    "wind_speed": 0.0,
-                    "solar_radiation": 0.0,
-                    "evaporation": 0.0,
-                    "dissolve_oxygen": 0.0,
-                    "velocity": 0.0,
-                    "water_volume": 0.0,
+                    **dict.fromkeys(API_FIELDS, 0.0),
                 }
 
-                value_details = {}
-
-                for device in self.config["devices"]:
-                    port = device["port"]
-                    for sensor in device["sensors"]:
-                        value = None
-                        if device["type"] == "modbus":
-                            if sensor["type"] == "4-20mA":
-                                value = self.modbusampere.read_analog(sensor, port)
-                            elif sensor["type"] == "digital_in":
-                                if self.rain_thread and sensor["name"] == "rainfall":
-                                    value_details = {
-                                        "realtime": self.rain_thread.rainfall_realtime,
-                                        "daily": self.rain_thread.rainfall_daily,
-                                        "hourly": self.rain_thread.rainfall_hourly,
-                                        "total": self.rain_thread.rainfall_total,
-                                        "unit": "mm",
-                                    }
-                                    value = self.rain_thread.rainfall_hourly
-                                else:
-                                    value = self.modbusampere.read_digital_inputs(
-                                        sensor, port
-                                    )
-                        elif (
-                            device["type"] == "direct_rs485"
-                            and device["name"] == "rs_rad"
-                        ):
-                            value = self.flowmeter.read_sensor_data(sensor, port)
-
-                        sensor_data = {}
-
-                        if self.rain_thread and sensor["name"] == "rainfall":
-                            print("kena di rainfall")
-                            sensor_data = {
-                                sensor["name"]: {
-                                    "sensor_type": sensor["type"],
-                                    "unit": sensor.get("conversion", {}).get(
-                                        "unit", ""
-                                    ),
-                                    "value": round(value_details["realtime"], 1)
-                                    if value_details["realtime"] is not None
-                                    else "ERROR",
-                                    "status": "OK" if value is not None else "error",
-                                    "values": value_details,
-                                }
-                            }
-
-                        else:
-                            sensor_data = {
-                                sensor["name"]: {
-                                    "sensor_type": sensor["type"],
-                                    "unit": sensor.get("conversion", {}).get(
-                                        "unit", ""
-                                    ),
-                                    "value": round(value, 1)
-                                    if value is not None
-                                    else "ERROR",
-                                    "status": "OK" if value is not None else "error",
-                                    "value_details": value_details,
-                                }
-                            }
-
-                        payload_mqtt["sensors"].append(sensor_data)
-
-                        if value is not None and sensor["name"] in payload_api:
-                            payload_api[sensor["name"]] = (
-                                round(value, 1)
-                                if isinstance(value, (int, float))
-                                else int(value)
-                            )
-
-                            if self.rain_thread and sensor["name"] == "rainfall":
-                                payload_api["rainfall_daily"] = (
-                                    round(self.rain_thread.rainfall_daily, 1)
-                                    if isinstance(
-                                        self.rain_thread.rainfall_daily, (int, float)
-                                    )
-                                    else int(self.rain_thread.rainfall_daily)
-                                )
+                # Frekuensi input pulse (anemometer) selama siklus publish ini
+                for key, channel in self.pulse_channels.items():
+                    self.readings[key] = channel.reading()
+                for bank in self.pulse_banks.values():
+                    for key, reading in bank.input_readings():
+                        self.readings[key] = reading
+                if self.rain_counter:
+                    rain = self.rain_reading()
+                    for key in self.rain_keys:
+                        self.readings[key] = rain
+
+                # Sensor virtual dari nilai di atas, tanpa transaksi bus
+                self.virtual.evaluate(self.readings, time.monotonic())
+
+                # Nilai terbaru dari PollScheduler; tiap span dibaca
+                # sesuai interval sensor tercepatnya, bukan per siklus publish
+                sensors_payload = payload_mqtt["sensors"]
+                for sensor in self.sensors:
+                    sensor.publish(sensor, self.readings, sensors_payload, payload_api)
+
+                bus_stats = dict(self.bus_stats)
+                self.bus_stats = {"bus_reads": 0, "saved_reads": 0}
+                payload_mqtt["bus_stats"] = bus_stats
+                payload_mqtt["circuit_breakers"] = self.arbiter.breaker_states()
+                print(
+                    f"📊 Modbus: {bus_stats['bus_reads']} transaksi, "
+                    f"{bus_stats['saved_reads']} dihemat oleh span"
+                )
+                jobs = self.scheduler.stats()
+                for name, job in jobs.items():
+                    print(
+                        f"⏱️ {name}: {job['runs']}x, error {job['errors']}, "
+                        f"telat maks {job['max_late_ms']} ms, "
+                        f"jarak maks {job['max_gap_ms']} ms, "
+                        f"ditunda {job['deferrals']}x"
+                    )
+                payload_mqtt["pulse_banks"] = {}
+                for bank in self.pulse_banks.values():
+                    pulse = payload_mqtt["pulse_banks"][bank.name] = bank.stats()
+                    # Jarak terburuk antar poll input pulse vs yang dijamin
+                    job = jobs[bank.name]
+                    pulse["max_gap_ms"] = round(bank.job.max_gap * 1000, 1)
+                    pulse["worst_gap_ms"] = job["max_gap_ms"]
+                    pulse["worst_gap_ever_ms"] = job["worst_gap_ms"]
+                    pulse["gap_overruns"] = job["overruns"]
+                    print(
+                        f"🌧️ {bank.name}: jarak poll terburuk {pulse['worst_gap_ms']} ms "
+                        f"(dijamin {pulse['max_gap_ms']} ms, "
+                        f"terlampaui {pulse['gap_overruns']}x)"
+                    )
+                    print(
+                        f"🌧️ {bank.name}: periode {pulse['interval_ms']} ms "
+                        f"(config {pulse['base_interval_ms']} ms), "
+                        f"hemat {pulse['saved_polls']} poll ({pulse['saved_pct']}%, "
+                        f"{pulse['saved_bus_ms_per_s']} ms bus/s), "
+                        f"closure {pulse['closure_ms']} ms, margin {pulse['margin_ms']} ms"
+                    )
+                payload_mqtt["device_latency"] = self.device_latency()
+                for device, latency in payload_mqtt["device_latency"].items():
+                    print(
+                        f"📟 {device}: {latency['reads']} baca, error {latency['errors']}, "
+                        f"rata-rata {latency['avg_ms']} ms, maks {latency['max_ms']} ms"
+                    )
+                for port, client in self.arbiter.clients.items():
+                    for slave, latency in client.latency_stats().items():
+                        print(
+                            f"⏱️ {port}#{slave}: latency p95 {latency['p95_ms']} ms, "
+                            f"timeout {latency['timeout_ms']} ms"
+                        )
 
                 print(payload_mqtt)
+                await self.show_sensors(sensors_payload)
 
                 topic = self.config["mqtt"]["base_topic"]
                 self.mqtt_client.publish(
@@ -351,22 +634,28 @@ class RTU:
 
                 # Kirim ke API jika ada perintah report
                 if self.report_requested:
-                    self.send_telemetry(payload_api)
+                    await asyncio.to_thread(self.send_telemetry, payload_api)
                     self.report_requested = False
 
-                time.sleep(30)
+                await asyncio.sleep(PUBLISH_INTERVAL)
 
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, asyncio.CancelledError):
             print("🛑 Received interrupt, shutting down...")
         except Exception as e:
             print(f"❌ Error in main loop: {e}")
         finally:
             print("🧹 Cleaning up...")
-            # Hentikan semua thread
+            # Hentikan camera thread dan task rain counter
             if hasattr(self, "camera_thread"):
                 self.camera_thread.stop()
-            if hasattr(self, "rain_thread") and self.rain_thread:
-                self.rain_thread.stop()
+            if hasattr(self, "rain_counter") and self.rain_counter:
+                self.rain_counter.stop()
+            if hasattr(self, "scheduler"):
+                self.scheduler.stop()
+            if hasattr(self, "arbiter"):
+                self.arbiter.close()
+            if hasattr(self, "ports"):
+                self.ports.close()
             print("✅ Cleanup completed")
 
         if self.restart_requested:
@@ -377,8 +666,8 @@ class RTU:
             self.mqtt_client.publish(topic, "restarted", qos="2", retain=True)
             if hasattr(self, "camera_thread"):
                 self.camera_thread.stop()
-            if hasattr(self, "rain_thread") and self.rain_thread:
-                self.rain_thread.stop()
+            if hasattr(self, "rain_counter") and self.rain_counter:
+                self.rain_counter.stop()
             subprocess.run(["sudo", "reboot"], check=True)
 
 
@@ -456,4 +745,4 @@ def sync_system_time():
 if __name__ == "__main__":
     sync_system_time()
     gateway = RTU(None)
-    gateway.monitor_all_devices()
+    asyncio.run(gateway.run())
@@ -0,0 +1,205 @@
+import struct
+import time
+
+# Codec frame Modbus RTU dipakai bersama oleh asyncrtu dan script lama.
+# Request ditulis ke buffer yang dipakai ulang, respons didecode langsung
+# dari buffer penerima (memoryview) tanpa salinan perantara.
+
+MAX_FRAME = 256  # panjang maksimum ADU Modbus RTU
+
+
+def _make_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC_TABLE = _make_crc_table()
+
+try:
+    # Loop C milik crcmod dengan tabel yang sama, jauh lebih cepat di Pi
+    from crcmod._crcfunext import _crc16r
+
+    _CRC_TABLE_PACKED = struct.pack("256H", *CRC_TABLE)
+except ImportError:
+    _crc16r = None
+
+
+def crc16_table(data, crc=0xFFFF, table=CRC_TABLE):
+    """CRC16 Modbus berbasis tabel 256 entri (Python murni)"""
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+if _crc16r is not None:
+
+    def crc16(data, crc=0xFFFF):
+        return _crc16r(data, crc, _CRC_TABLE_PACKED)
+
+else:
+    crc16 = crc16_table
+
+
+class ModbusError(Exception):
+    """Slave membalas dengan exception response (function code | 0x80)"""
+
+
+_READ = struct.Struct(">BBHH")
+_WRITE_MULTIPLE = struct.Struct(">BBHHB")
+_CRC = struct.Struct("<H")
+_REGISTERS = {}
+
+
+def _registers_struct(count):
+    fmt = _REGISTERS.get(count)
+    if fmt is None:
+        fmt = _REGISTERS[count] = struct.Struct(f">{count}H")
+    return fmt
+
+
+class FrameEncoder:
+    """
+    Penyusun frame request. Request tulis berupa memoryview ke buffer
+    internal yang ditimpa oleh encode berikutnya, jadi harus langsung
+    dikirim. Request baca selalu sama untuk span yang sama, jadi frame-nya
+    disimpan dan dipakai ulang.
+    """
+
+    def __init__(self):
+        self._buf = bytearray(MAX_FRAME)
+        self._view = memoryview(self._buf)
+        self._reads = {}
+
+    def _finish(self, length):
+        _CRC.pack_into(self._buf, length, crc16(self._view[:length]))
+        return self._view[: length + 2]
+
+    def read_request(self, slave, functioncode, address, count):
+        """Request fc 1/2/3/4"""
+        key = (slave, functioncode, address, count)
+        frame = self._reads.get(key)
+        if frame is None:
+            _READ.pack_into(self._buf, 0, slave, functioncode, address, count)
+            frame = self._reads[key] = bytes(self._finish(6))
+        return frame
+
+    def write_register_request(self, slave, address, value):
+        """Request fc 6"""
+        _READ.pack_into(self._buf, 0, slave, 6, address, value)
+        return self._finish(6)
+
+    def write_registers_request(self, slave, address, values):
+        """Request fc 16"""
+        count = len(values)
+        _WRITE_MULTIPLE.pack_into(self._buf, 0, slave, 16, address, count, 2 * count)
+        _registers_struct(count).pack_into(self._buf, 7, *values)
+        return self._finish(7 + 2 * count)
+
+
+def response_length(functioncode, count):
+    """Panjang respons normal (byte, termasuk CRC) untuk request yang dikirim"""
+    if functioncode in (1, 2):
+        return 5 + (count + 7) // 8
+    if functioncode in (3, 4):
+        return 5 + 2 * count
+    return 8  # fc 5/6/15/16 memantulkan alamat & jumlah
+
+
+def check_response(frame, request):
+    """
+    Validasi frame respons terhadap request-nya. CRC dihitung atas seluruh
+    frame termasuk CRC-nya sendiri, hasilnya 0 jika frame utuh. Byte count
+    (fc 1-4) dan echo alamat (fc 5/6/15/16) ikut dicek supaya respons telat
+    milik request lain tidak lolos.
+    """
+    slave, functioncode = request[0], request[1]
+    if crc16(frame) != 0:
+        raise IOError(f"CRC tidak valid dari slave {slave}")
+    if frame[0] != slave:
+        raise IOError(f"Respons dari slave {frame[0]}, harusnya {slave}")
+    if frame[1] & 0x80:
+        raise ModbusError(
+            f"Slave {slave} exception code {frame[2]} (fc {functioncode})"
+        )
+    if frame[1] != functioncode:
+        raise IOError(f"Function code respons {frame[1]} != {functioncode}")
+    if functioncode <= 4:
+        # frame sudah dipotong sepanjang respons yang diharapkan
+        if frame[2] != len(frame) - 5:
+            raise IOError(
+                f"Byte count respons {frame[2]} != {len(frame) - 5} dari slave {slave}"
+            )
+    elif frame[2:6] != request[2:6]:
+        raise IOError(f"Echo alamat respons slave {slave} tidak cocok dengan request")
+
+
+def decode_registers(frame, count):
+    """Nilai register (tuple) dari respons fc 3/4"""
+    return _registers_struct(count).unpack_from(frame, 3)
+
+
+def decode_bits(frame, count):
+    """Nilai bit (list 0/1) dari respons fc 1/2"""
+    bits = []
+    for index in range(count):
+        bits.append((frame[3 + (index >> 3)] >> (index & 7)) & 1)
+    return bits
+
+
+if __name__ == "__main__":
+    # Micro-benchmark: python rtucodec.py
+    import crcmod
+
+    N = 100000
+    encoder = FrameEncoder()
+    reference = crcmod.mkCrcFun(0x18005, rev=True, initCrc=0xFFFF, xorOut=0x0000)
+
+    request = bytes(encoder.read_request(1, 3, 1000, 5))
+    assert crc16_table(request[:-2]) == reference(request[:-2])
+    assert crc16(request[:-2]) == reference(request[:-2])
+
+    payload = bytes([1, 3, 10]) + struct.pack(">5H", 1, 2, 3, 4, 5)
+    response = bytearray(payload + _CRC.pack(crc16(payload)))
+    view = memoryview(response)
+    check_response(view, request)
+    assert decode_registers(view, 5) == (1, 2, 3, 4, 5)
+
+    def bench(label, func):
+        start = time.perf_counter()
+        for _ in range(N):
+            func()
+        elapsed = time.perf_counter() - start
+        print(f"{label:<28} {N / elapsed:>12,.0f} frame/s")
+
+    print(f"CRC: {'crcmod C + tabel' if _crc16r is not None else 'tabel Python'}")
+    bench("crc16 (tabel Python)", lambda: crc16_table(payload))
+    bench("crc16 (dipakai)", lambda: crc16(payload))
+    bench("crcmod.mkCrcFun", lambda: reference(payload))
+    bench(
+        "encode lama (bytes + crcmod)",
+        lambda: (lambda frame: frame + reference(frame).to_bytes(2, "little"))(
+            bytes([1, 3, 0x03, 0xE8, 0, 5])
+        ),
+    )
+    bench("encode read_request", lambda: encoder.read_request(1, 3, 1000, 5))
+    bench("encode write_register", lambda: encoder.write_register_request(1, 1042, 7))
+
+    def decode_old(rx):
+        # Jalur asyncrtu sebelumnya: salin buffer, CRC atas slice, unpack slice
+        frame = bytes(rx[:15])
+        if reference(frame[:-2]) != struct.unpack("<H", frame[-2:])[0]:
+            raise IOError("CRC")
+        if frame[0] != 1 or frame[1] & 0x80 or frame[1] != 3:
+            raise IOError("frame")
+        return list(struct.unpack(">5H", frame[3:13]))
+
+    bench("decode lama (salin + slice)", lambda: decode_old(response))
+    bench(
+        "check + decode_registers",
+        lambda: (check_response(view, request), decode_registers(view, 5)),
+    )
@@ -0,0 +1,240 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+
+# Interval sampling default (detik) per tipe sensor jika config tidak mengisi
+# "interval". Prioritas: angka kecil = lebih penting.
+DEFAULT_INTERVALS = {"4-20mA": 30.0, "digital_in": 30.0, "rs485": 60.0}
+DEFAULT_INTERVAL = 30.0
+DEFAULT_PRIORITY = 5
+DURATION_HISTORY = 8  # durasi run terakhir untuk perkiraan lama job
+# Job yang terlambat lebih dari ini (atau dari intervalnya sendiri jika lebih
+# pendek) naik ke depan antrian, di atas prioritas
+STARVATION_LATENESS = 0.05
+
+
+def sensor_interval(sensor, default=None):
+    if default is None:
+        default = DEFAULT_INTERVALS.get(sensor.get("type"), DEFAULT_INTERVAL)
+    return float(sensor.get("interval", default))
+
+
+def sensor_priority(sensor, default=DEFAULT_PRIORITY):
+    return int(sensor.get("priority", default))
+
+
+class PollJob:
+    """
+    Satu pekerjaan polling berkala di satu bus. Job dengan max_gap dijamin
+    mulai paling lambat max_gap detik setelah run sebelumnya; budget adalah
+    fungsi perkiraan lama terburuk job (default: durasi terlama dari
+    beberapa run terakhir).
+    """
+
+    def __init__(self, name, port, interval, priority, func, max_gap=None, budget=None):
+        self.name = name
+        self.port = port
+        self.interval = interval
+        self.priority = priority
+        self.func = func
+        self.max_gap = max_gap
+        self.budget = budget
+        self.deadline = 0.0
+        self.last_start = None
+        self.durations = deque(maxlen=DURATION_HISTORY)
+
+        # Statistik
+        self.runs = 0
+        self.errors = 0
+        self.last_duration = 0.0
+        self.max_lateness = 0.0
+        self.max_gap_seen = 0.0  # jarak antar mulai terbesar sejak stats()
+        self.worst_gap = 0.0  # sejak start
+        self.overruns = 0  # jarak melewati max_gap
+        self.deferrals = 0  # ditunda demi job max_gap
+
+    def estimate(self):
+        if self.budget is not None:
+            return self.budget()
+        return max(self.durations) if self.durations else 0.0
+
+
+class PollScheduler:
+    """
+    Penjadwal polling berbasis deadline.
+
+    Tiap bus (port serial) punya priority queue deadline sendiri dan satu
+    coroutine worker, jadi bus yang berbeda tetap jalan bersamaan. Kalau
+    beberapa job jatuh tempo bersamaan, prioritas terkecil jalan duluan;
+    job yang sudah terlambat lebih dari STARVATION_LATENESS naik ke depan
+    supaya tidak kelaparan di samping job prioritas tinggi yang sering.
+
+    Job dengan max_gap (input pulse) dilindungi: job lain hanya dijalankan
+    kalau perkiraan lamanya masih muat sebelum batas mulai job tersebut.
+    Kalau tidak muat, job max_gap dijalankan lebih awal dan job lain
+    menyusul tepat setelahnya, dengan batas waktu dari window().
+    """
+
+    def __init__(self):
+        self.queues = {}
+        self.jobs = []
+        self.tasks = []
+        self.guards = {}  # port -> job dengan max_gap
+        self.previous = {}  # port -> job terakhir yang jalan
+        self.first_round = asyncio.Event()
+        self._seq = itertools.count()
+        self._pending_first = set()
+
+    def add(self, port, name, interval, priority, func, max_gap=None, budget=None):
+        job = PollJob(name, port, interval, priority, func, max_gap, budget)
+        job.deadline = time.monotonic()
+        heapq.heappush(
+            self.queues.setdefault(port, []), (job.deadline, next(self._seq), job)
+        )
+        self.jobs.append(job)
+        if max_gap is not None:
+            self.guards.setdefault(port, []).append(job)
+        self._pending_first.add(job)
+        return job
+
+    def start(self):
+        if not self.jobs:
+            self.first_round.set()
+        for port in self.queues:
+            self.tasks.append(asyncio.create_task(self.run_bus(port)))
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    def _pop_due(self, queue, now):
+        """Ambil job jatuh tempo dengan prioritas terbaik, None jika belum ada"""
+        if queue[0][0] > now:
+            return None
+
+        due = []
+        while queue and queue[0][0] <= now:
+            due.append(heapq.heappop(queue))
+
+        def rank(entry):
+            deadline, seq, job = entry
+            starving = now - deadline > min(job.interval, STARVATION_LATENESS)
+            return (-1 if starving else job.priority, deadline, seq)
+
+        due.sort(key=rank)
+        for entry in due[1:]:
+            heapq.heappush(queue, entry)
+        return due[0][2]
+
+    def _blocking_guard(self, port, job, now):
+        """Job max_gap yang batasnya terlewati jika job dijalankan sekarang"""
+        guards = self.guards.get(port)
+        if not guards or job.max_gap is not None:
+            return None
+        finish = now + job.estimate()
+        for guard in guards:
+            # Guard baru saja jalan: job ini memang lebih lama dari max_gap,
+            # jalankan sekarang daripada menunda terus (dihitung overrun)
+            if guard.last_start is None or self.previous.get(port) is guard:
+                continue
+            latest = guard.last_start + guard.max_gap - guard.estimate()
+            if finish > latest:
+                return guard
+        return None
+
+    def window(self, port):
+        """
+        Waktu (monotonic) transaksi lain di bus ini harus sudah selesai
+        supaya poll job max_gap berikutnya tetap tepat waktu, None jika bus
+        tidak punya job max_gap. Dipakai untuk memotong timeout transaksi
+        (mis. probe slave mati) yang tidak muat di sela poll pulse.
+        """
+        latest = None
+        for guard in self.guards.get(port, ()):
+            # Belum pernah jalan: segera jalan, dihitung dari sekarang
+            start = guard.last_start
+            if start is None:
+                start = max(guard.deadline, time.monotonic())
+            limit = start + guard.max_gap - guard.estimate()
+            if latest is None or limit < latest:
+                latest = limit
+        return latest
+
+    def _take(self, queue, job):
+        """Keluarkan job dari heap bus (queue kecil, cukup linear)"""
+        for index, entry in enumerate(queue):
+            if entry[2] is job:
+                queue[index] = queue[-1]
+                queue.pop()
+                heapq.heapify(queue)
+                return
+
+    async def run_bus(self, port):
+        queue = self.queues[port]
+        while True:
+            now = time.monotonic()
+            job = self._pop_due(queue, now)
+            if job is None:
+                await asyncio.sleep(queue[0][0] - now)
+                continue
+
+            guard = self._blocking_guard(port, job, now)
+            if guard is not None:
+                # Tidak muat: kembalikan job, jalankan guard lebih awal
+                heapq.heappush(queue, (job.deadline, next(self._seq), job))
+                self._take(queue, guard)
+                job.deferrals += 1
+                job = guard
+                job.deadline = min(job.deadline, now)
+
+            started = time.monotonic()
+            job.max_lateness = max(job.max_lateness, started - job.deadline)
+            if job.last_start is not None:
+                gap = started - job.last_start
+                job.max_gap_seen = max(job.max_gap_seen, gap)
+                job.worst_gap = max(job.worst_gap, gap)
+                if job.max_gap is not None and gap > job.max_gap:
+                    job.overruns += 1
+            job.last_start = started
+            self.previous[port] = job
+            try:
+                await job.func()
+            except Exception as e:
+                job.errors += 1
+                print(f"[Scheduler] {job.name} error: {e}")
+            finished = time.monotonic()
+            job.runs += 1
+            job.last_duration = finished - started
+            job.durations.append(job.last_duration)
+
+            # Deadline berikutnya dihitung dari deadline lama supaya tidak
+            # drift; kalau sudah tertinggal, hitung dari waktu mulai
+            job.deadline += job.interval
+            if job.deadline < finished:
+                job.deadline = started + job.interval
+            heapq.heappush(queue, (job.deadline, next(self._seq), job))
+
+            if job in self._pending_first:
+                self._pending_first.discard(job)
+                if not self._pending_first:
+                    self.first_round.set()
+
+    def stats(self):
+        """Ringkasan per job, lalu reset keterlambatan maksimum"""
+        summary = {}
+        for job in self.jobs:
+            summary[job.name] = {
+                "runs": job.runs,
+                "errors": job.errors,
+                "max_late_ms": round(job.max_lateness * 1000, 1),
+                "max_gap_ms": round(job.max_gap_seen * 1000, 1),
+                "worst_gap_ms": round(job.worst_gap * 1000, 1),
+                "deferrals": job.deferrals,
+                "overruns": job.overruns,
+            }
+            job.max_lateness = 0.0
+            job.max_gap_seen = 0.0
+        return summary
@@ -0,0 +1,239 @@
+import time
+
+from calibration import validate_calibration
+from registerdriver import sensor_format
+from virtualsensor import NO_READING, VirtualSensors
+
+# Field sensor yang wajib ada per (tipe device, tipe sensor) yang punya driver.
+# Device/sensor di luar tabel ini tetap dipublish (status error) tapi tidak
+# dibaca, sama seperti sebelumnya; cukup diberi peringatan.
+SUPPORTED = {
+    "modbus": {
+        "4-20mA": ("slave_address", "channel"),
+        "digital_in": ("slave_address", "channel"),
+    },
+    "direct_rs485": {
+        "rs485": ("slave_address", "register_address"),
+    },
+}
+ANALOG_CONVERSION = ("input_min", "input_max", "output_min", "output_max")
+
+VIRTUAL_TYPE = "virtual"
+
+
+class ConfigError(ValueError):
+    """Config sensor tidak valid; pesan berisi semua field yang salah"""
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _check_sensor(device, sensor, where, errors, warnings):
+    for field in ("name", "type"):
+        if not isinstance(sensor.get(field), str):
+            errors.append(f"{where}.{field} wajib berupa string")
+    driver_types = SUPPORTED.get(device.get("type"))
+    if driver_types is None:
+        return
+    required = driver_types.get(sensor.get("type"))
+    if required is None:
+        warnings.append(
+            f"{where} ({sensor.get('name')}): tipe {sensor.get('type')} tidak "
+            f"didukung device {device.get('type')}, tidak dibaca"
+        )
+        return
+    for field in required:
+        if not isinstance(sensor.get(field), int) or isinstance(sensor[field], bool):
+            errors.append(f"{where}.{field} wajib berupa integer")
+
+    conversion = sensor.get("conversion", {})
+    if sensor["type"] == "4-20mA":
+        # Lookup table kalibrasi menggantikan conversion linear; conversion
+        # linear tetap diperiksa jika ada (dipakai saat kalibrasi dilepas)
+        calibrated = "calibration" in sensor
+        if calibrated:
+            try:
+                validate_calibration(sensor["calibration"])
+            except ValueError as e:
+                errors.append(f"{where}: {e}")
+        if calibrated and not any(field in conversion for field in ANALOG_CONVERSION):
+            return
+        for field in ANALOG_CONVERSION:
+            if not _is_number(conversion.get(field)):
+                errors.append(f"{where}.conversion.{field} wajib berupa angka")
+        if conversion.get("input_max") == conversion.get("input_min"):
+            errors.append(f"{where}.conversion input_max sama dengan input_min")
+    elif sensor["type"] == "rs485":
+        try:
+            sensor_format(sensor)
+        except ValueError as e:
+            errors.append(f"{where}: {e}")
+        if not _is_number(conversion.get("scaling_factor", 1)):
+            errors.append(f"{where}.conversion.scaling_factor wajib berupa angka")
+
+
+def validate_config(config):
+    """
+    Periksa struktur config sebelum dipakai. Semua kesalahan dikumpulkan
+    lalu dilempar sekaligus sebagai ConfigError; hal yang hanya membuat
+    sensor tidak dibaca dikembalikan sebagai daftar peringatan.
+    """
+    errors = []
+    warnings = []
+    if not isinstance(config, dict):
+        raise ConfigError("config harus berupa object JSON")
+    serial_ports = config.get("serial_ports")
+    if not isinstance(serial_ports, dict):
+        errors.append("serial_ports wajib berupa object")
+        serial_ports = {}
+    devices = config.get("devices")
+    if not isinstance(devices, list):
+        raise ConfigError("\n".join(errors + ["devices wajib berupa list"]))
+
+    for d_idx, device in enumerate(devices):
+        where = f"devices[{d_idx}]"
+        if not isinstance(device, dict):
+            errors.append(f"{where} harus berupa object")
+            continue
+        for field in ("name", "type", "port"):
+            if not isinstance(device.get(field), str):
+                errors.append(f"{where}.{field} wajib berupa string")
+        if not isinstance(device.get("sensors"), list):
+            errors.append(f"{where}.sensors wajib berupa list")
+            continue
+
+        if device.get("type") not in SUPPORTED:
+            warnings.append(
+                f"{where} ({device.get('name')}): tipe {device.get('type')} "
+                f"tidak punya driver, sensornya tidak dibaca"
+            )
+        elif device.get("port") not in serial_ports:
+            warnings.append(
+                f"{where} ({device.get('name')}): port {device.get('port')} "
+                f"tidak ada di serial_ports, sensornya tidak dibaca"
+            )
+
+        for s_idx, sensor in enumerate(device["sensors"]):
+            if not isinstance(sensor, dict):
+                errors.append(f"{where}.sensors[{s_idx}] harus berupa object")
+                continue
+            _check_sensor(device, sensor, f"{where}.sensors[{s_idx}]", errors, warnings)
+
+    if "virtual_sensors" in config:
+        try:
+            VirtualSensors(config)
+        except ValueError as e:
+            errors.append(f"virtual_sensors: {e}")
+
+    if errors:
+        raise ConfigError("\n".join(errors))
+    return warnings
+
+
+class Sensor:
+    """
+    Sensor hasil kompilasi config. Semua yang dulu dicari ulang tiap siklus
+    publish (unit, field API, cara publish) sudah dihitung di sini; publish
+    adalah fungsi (sensor, readings, sensors_payload, payload_api).
+    """
+
+    __slots__ = (
+        "key",
+        "name",
+        "type",
+        "unit",
+        "api_field",
+        "publish",
+        "entry",
+        "payload",
+    )
+
+    def __init__(self, key, conf, api_field):
+        self.key = key
+        self.name = conf["name"]
+        # Sensor virtual tidak punya type/conversion, unit langsung di conf
+        self.type = conf.get("type", VIRTUAL_TYPE)
+        self.unit = conf.get("conversion", {}).get("unit", conf.get("unit", ""))
+        self.api_field = api_field
+        self.publish = publish_reading
+        # Entri payload MQTT dibuat sekali; tiap siklus hanya nilai, status
+        # dan detail yang ditimpa, jadi payload harus diserialisasi sebelum
+        # siklus berikutnya (seperti di loop publish)
+        self.entry = {
+            "sensor_type": self.type,
+            "unit": self.unit,
+            "value": "ERROR",
+            "status": "error",
+            "value_details": {},
+        }
+        self.payload = {self.name: self.entry}
+
+
+def publish_reading(sensor, readings, sensors_payload, payload_api):
+    """Publish standar: nilai terakhir dari readings (hasil PollScheduler)"""
+    value, details = readings.get(sensor.key, NO_READING)
+    entry = sensor.entry
+    ok = value is not None
+    entry["value"] = round(value, 1) if ok else "ERROR"
+    entry["status"] = "OK" if ok else "error"
+    entry["value_details"] = details
+    sensors_payload.append(sensor.payload)
+    if ok and sensor.api_field is not None:
+        payload_api[sensor.api_field] = (
+            round(value, 1) if isinstance(value, (int, float)) else int(value)
+        )
+
+
+def compile_config(config, api_fields=()):
+    """
+    Kompilasi config (sudah lolos validate_config) jadi list Sensor datar
+    sesuai urutan publish, key (d_idx, s_idx) sama dengan key readings
+    hasil polling. Sensor virtual dipublish setelah sensor fisik, dengan
+    key ("virtual", name) di readings (lihat VirtualSensors.evaluate).
+    """
+    sensors = []
+    for d_idx, device in enumerate(config["devices"]):
+        for s_idx, conf in enumerate(device["sensors"]):
+            name = conf["name"]
+            sensors.append(
+                Sensor((d_idx, s_idx), conf, name if name in api_fields else None)
+            )
+    for spec in config.get("virtual_sensors", []):
+        name = spec["name"]
+        sensors.append(
+            Sensor(("virtual", name), spec, name if name in api_fields else None)
+        )
+    return sensors
+
+
+if __name__ == "__main__":
+    # Benchmark overhead siklus publish: python sensorconfig.py [config.json]
+    import json
+    import sys
+
+    config_file = (
+        sys.argv[1] if len(sys.argv) > 1 else "sensor_config_digital_input.json"
+    )
+    with open(config_file) as f:
+        config = json.load(f)
+    for warning in validate_config(config):
+        print(f"⚠️ {warning}")
+
+    api_fields = ("ph", "tds", "tss", "debit", "water_height", "velocity")
+    sensors = compile_config(config, api_fields)
+    readings = {sensor.key: (float(index), {}) for index, sensor in enumerate(sensors)}
+
+    def cycle_compiled():
+        payload_sensors = []
+        payload_api = dict.fromkeys(api_fields, 0.0)
+        for sensor in sensors:
+            sensor.publish(sensor, readings, payload_sensors, payload_api)
+
+    N = 20000
+    print(f"{len(sensors)} sensor dari {config_file}")
+    started = time.perf_counter()
+    for _ in range(N):
+        cycle_compiled()
+    elapsed = time.perf_counter() - started
+    print(f"{elapsed / N * 1e6:8.2f} µs per siklus publish")
@@ -0,0 +1,315 @@
+import json
+import sys
+
+from asyncrtu import char_time
+from scheduler import sensor_interval, sensor_priority
+
+DEFAULT_GAP_TOLERANCE = 4  # register kosong yang boleh ikut dibaca
+DEFAULT_MAX_REGISTERS = 125  # batas register per PDU (Modbus: 125)
+MAX_BITS = 2000  # batas coil/discrete input per PDU
+DEFAULT_TURNAROUND = 0.01  # perkiraan waktu proses slave (detik)
+GAP_MARGIN = 0.005  # cadangan jitter event loop di atas max_gap minimum
+
+
+def sensor_registers(device, sensor):
+    """
+    Posisi sensor di bus: (functioncode, address, width).
+    None jika sensor tidak dibaca lewat register Modbus.
+    """
+    if device["type"] == "modbus":
+        # Modul Wellpro: analog di holding register 0..5, DI di discrete input
+        if sensor["type"] == "4-20mA":
+            return 3, sensor["channel"], 1
+        if sensor["type"] == "digital_in":
+            return 2, sensor["channel"], 1
+    elif device["type"] == "direct_rs485" and "register_address" in sensor:
+        register_type = sensor.get("conversion", {}).get("register_type", "")
+        width = 2 if register_type.startswith("32") else 1
+        return 3, sensor["register_address"], width
+    return None
+
+
+class ReadSpan:
+    """Satu transaksi baca yang melayani beberapa sensor sekaligus"""
+
+    def __init__(self, port, slave, functioncode, start):
+        self.port = port
+        self.slave = slave
+        self.functioncode = functioncode
+        self.start = start
+        self.count = 0
+        # (key, device, sensor, offset) - offset relatif terhadap start
+        self.entries = []
+        self.plan = None  # DecodePlan / AnalogPlan dari driver device
+        self.device = None  # label device untuk statistik latency
+
+    @property
+    def end(self):
+        return self.start + self.count
+
+    @property
+    def name(self):
+        return (
+            f"{self.port}#{self.slave} fc{self.functioncode} {self.start}+{self.count}"
+        )
+
+    @property
+    def interval(self):
+        """Span dibaca mengikuti sensor tercepat di dalamnya"""
+        return min(sensor_interval(entry[2]) for entry in self.entries)
+
+    @property
+    def priority(self):
+        return min(sensor_priority(entry[2]) for entry in self.entries)
+
+    def add(self, key, device, sensor, address, width):
+        self.count = max(self.count, address + width - self.start)
+        self.entries.append((key, device, sensor, address - self.start))
+
+    def frame_sizes(self):
+        """Panjang frame request dan respons (byte, termasuk CRC)"""
+        if self.functioncode in (1, 2):
+            return 8, 5 + (self.count + 7) // 8
+        return 8, 5 + 2 * self.count
+
+
+def transaction_time(span, params, turnaround=DEFAULT_TURNAROUND):
+    """Perkiraan lama satu transaksi span di bus (detik)"""
+    t_char = char_time(
+        params.get("baudrate", 9600),
+        params.get("bytesize", 8),
+        params.get("parity", "N"),
+        params.get("stopbits", 1),
+    )
+    request, response = span.frame_sizes()
+    silent = max(3.5 * t_char, 0.00175)
+    return (request + response) * t_char + 2 * silent + turnaround
+
+
+def plan_spans(config, skip=None):
+    """
+    Hitung set span baca minimal per slave dari semua sensor di config.
+    Register yang berdekatan (selisih <= gap_tolerance) digabung selama
+    panjang span tidak melewati max_registers.
+    """
+    planner = config.get("planner", {})
+    gap_tolerance = planner.get("gap_tolerance", DEFAULT_GAP_TOLERANCE)
+    max_registers = planner.get("max_registers", DEFAULT_MAX_REGISTERS)
+
+    groups = {}
+    for d_idx, device in enumerate(config["devices"]):
+        for s_idx, sensor in enumerate(device["sensors"]):
+            if skip is not None and skip(device, sensor):
+                continue
+            location = sensor_registers(device, sensor)
+            if location is None:
+                continue
+            functioncode, address, width = location
+            group = (device["port"], sensor["slave_address"], functioncode)
+            groups.setdefault(group, []).append(
+                (address, width, (d_idx, s_idx), device, sensor)
+            )
+
+    spans = []
+    for (port, slave, functioncode), items in groups.items():
+        limit = MAX_BITS if functioncode in (1, 2) else max_registers
+        items.sort(key=lambda item: item[0])
+        span = None
+        for address, width, key, device, sensor in items:
+            if (
+                span is None
+                or address > span.end + gap_tolerance
+                or address + width - span.start > limit
+            ):
+                span = ReadSpan(port, slave, functioncode, address)
+                spans.append(span)
+            span.add(key, device, sensor, address, width)
+    return spans
+
+
+def bank_time(bank, params, turnaround=DEFAULT_TURNAROUND):
+    """Perkiraan lama satu poll PulseBank (read_bits semua channel)"""
+    bank_span = ReadSpan(bank.port, bank.slave, bank.functioncode, 0)
+    bank_span.count = bank.bit_count
+    return transaction_time(bank_span, params, turnaround)
+
+
+def _sensor_entries(span):
+    """(key, device, sensor, alamat, lebar) per sensor span, urut alamat"""
+    entries = []
+    for key, device, sensor, offset in sorted(span.entries, key=lambda e: e[3]):
+        address = span.start + offset
+        width = sensor_registers(device, sensor)[2]
+        entries.append((key, device, sensor, address, width))
+    return entries
+
+
+def sensor_time(span, params, turnaround=DEFAULT_TURNAROUND):
+    """Transaksi terpendek yang masih bisa dicapai span: baca satu sensor terlebar"""
+    return max(
+        transaction_time(_piece(span, address, address + width), params, turnaround)
+        for _, _, _, address, width in _sensor_entries(span)
+    )
+
+
+def fit_max_gap(banks, spans, serial_ports, turnaround=DEFAULT_TURNAROUND):
+    """
+    max_gap default bank dinaikkan ke jarak terkecil yang bisa dipenuhi bus:
+    satu poll bank + baca satu sensor terlama di port itu + GAP_MARGIN. Di
+    baudrate rendah max_gap dari min_width saja tidak mungkin dijamin.
+    max_gap dari config ("max_gap_ms") tidak diubah; kalau tidak muat,
+    chunk_spans memberi peringatan.
+    """
+    for bank in banks:
+        params = serial_ports.get(bank.port, {})
+        longest = max(
+            (
+                sensor_time(span, params, turnaround)
+                for span in spans
+                if span.port == bank.port
+            ),
+            default=0.0,
+        )
+        floor = bank_time(bank, params, turnaround) + longest + GAP_MARGIN
+        if bank.max_gap_fixed or floor <= bank.max_gap:
+            continue
+        bank.max_gap = floor
+        min_width = min(channel.min_width for channel in bank.channels)
+        print(
+            f"⚠️ {bank.name}: max_gap dinaikkan ke {floor * 1000:.1f} ms "
+            f"(bus {params.get('baudrate', 9600)} baud), closure di bawah "
+            f"{(floor + min_width) * 1000:.0f} ms bisa terlewat"
+        )
+
+
+def gap_windows(banks, serial_ports, turnaround=DEFAULT_TURNAROUND):
+    """
+    Waktu maksimum satu transaksi lain per port yang ada PulseBank-nya:
+    max_gap bank dikurangi lama poll bank itu sendiri.
+    """
+    windows = {}
+    for bank in banks:
+        window = bank.max_gap - bank_time(
+            bank, serial_ports.get(bank.port, {}), turnaround
+        )
+        windows[bank.port] = min(windows.get(bank.port, window), window)
+    return windows
+
+
+def _piece(span, start, end):
+    piece = ReadSpan(span.port, span.slave, span.functioncode, start)
+    piece.count = end - start
+    return piece
+
+
+def chunk_spans(spans, max_time, serial_ports, turnaround=DEFAULT_TURNAROUND):
+    """
+    Pecah span yang transaksinya lebih lama dari max_time[port] menjadi
+    beberapa span berurutan tanpa memotong register satu sensor, supaya
+    poll input pulse bisa diselipkan di antaranya. Port tanpa batas dan
+    span yang sudah muat dibiarkan. Kalau register satu sensor pun tidak
+    muat, memecah hanya menambah transaksi tanpa memenuhi jaminan: span
+    dibiarkan utuh dan diberi peringatan.
+    """
+    result = []
+    for span in spans:
+        limit = max_time.get(span.port)
+        params = serial_ports.get(span.port, {})
+        if limit is None or transaction_time(span, params, turnaround) <= limit:
+            result.append(span)
+            continue
+
+        entries = _sensor_entries(span)
+        single = sensor_time(span, params, turnaround)
+        if single > limit:
+            print(
+                f"⚠️ {span.name}: baca satu sensor butuh {single * 1000:.1f} ms, "
+                f"melebihi jendela {limit * 1000:.1f} ms di sela poll pulse; "
+                f"span tidak dipecah, max_gap tidak bisa dijamin"
+            )
+            result.append(span)
+            continue
+
+        chunk = None
+        for key, device, sensor, address, width in entries:
+            if chunk is not None:
+                end = max(chunk.end, address + width)
+                trial = _piece(span, chunk.start, end)
+                if transaction_time(trial, params, turnaround) > limit:
+                    chunk = None
+            if chunk is None:
+                chunk = ReadSpan(span.port, span.slave, span.functioncode, address)
+                result.append(chunk)
+            chunk.add(key, device, sensor, address, width)
+    return result
+
+
+def print_plan(config, spans):
+    serial_ports = config.get("serial_ports", {})
+    sensor_count = sum(len(span.entries) for span in spans)
+    print(f"📋 {len(spans)} span untuk {sensor_count} sensor")
+
+    per_port = {}
+    for span in spans:
+        params = serial_ports.get(span.port, {})
+        t = transaction_time(span, params)
+        stats = per_port.setdefault(span.port, {"cycle": 0.0, "load": 0.0})
+        stats["cycle"] += t
+        stats["load"] += t / span.interval
+        names = ", ".join(entry[2]["name"] for entry in span.entries)
+        print(
+            f"  {span.name:<40} tiap {span.interval:>6.2f}s "
+            f"prio {span.priority}  {t * 1000:6.1f} ms  [{names}]"
+        )
+
+    for port, stats in per_port.items():
+        baudrate = serial_ports.get(port, {}).get("baudrate", 9600)
+        print(
+            f"⏱️ {port} @ {baudrate} baud: {stats['cycle'] * 1000:.1f} ms per siklus, "
+            f"beban bus {stats['load'] * 100:.2f}%"
+        )
+
+
+if __name__ == "__main__":
+    # Dry run: python spanplanner.py sensors_config.json
+    config_file = sys.argv[1] if len(sys.argv) > 1 else "sensors_config.json"
+    with open(config_file) as f:
+        config = json.load(f)
+
+    # Sama dengan RTU.build_schedule: input pulse (termasuk rainfall) dan DI
+    # biasa di modul yang sama dibaca PulseBank, span lain dipecah mengikuti
+    # jendela max_gap bank
+    from pulsecounter import PulseBank, PulseChannel, bank_for_input, is_pulse_sensor
+
+    banks = {}
+    for device in config["devices"]:
+        if device["type"] != "modbus":
+            continue
+        for sensor in device["sensors"]:
+            if is_pulse_sensor(sensor):
+                group = (device["port"], sensor["slave_address"])
+                bank = banks.get(group)
+                if bank is None:
+                    bank = banks[group] = PulseBank(None, *group)
+                bank.add(PulseChannel.from_sensor(sensor), sensor)
+    for device in config["devices"]:
+        if device["type"] != "modbus":
+            continue
+        for sensor in device["sensors"]:
+            bank = bank_for_input(banks, device, sensor)
+            if bank is not None:
+                bank.add_input(sensor["name"], sensor)
+    serial_ports = config.get("serial_ports", {})
+    spans = plan_spans(
+        config,
+        skip=lambda device, sensor: is_pulse_sensor(sensor)
+        or bank_for_input(banks, device, sensor) is not None,
+    )
+    fit_max_gap(banks.values(), spans, serial_ports)
+    spans = chunk_spans(spans, gap_windows(banks.values(), serial_ports), serial_ports)
+    print_plan(config, spans)
+    for bank in banks.values():
+        print(
+            f"🌧️ {bank.name}: {bank.bit_count} bit ({len(bank.inputs)} DI biasa) tiap "
+            f"{bank.interval * 1000:.0f} ms, max_gap {bank.max_gap * 1000:.0f} ms"
+        )
@@ -0,0 +1,49 @@
+import pytest
+
+from calibration import ADC_SIZE, RAW_TO_MA, CalibrationTable, calibration_curve
+
+PH = {"type": "piecewise", "points": [[4, 0], [8, 3.9], [12, 7.1], [20, 14]]}
+
+
+def test_table_matches_curve():
+    table = CalibrationTable(PH)
+    curve = calibration_curve(PH)
+    for raw in range(ADC_SIZE):
+        assert table(raw) == curve(raw * RAW_TO_MA)
+    # Di luar titik pertama/terakhir nilai ditahan, raw kebesaran dijepit
+    assert table(0) == 0 and table(ADC_SIZE - 1) == 14 and table(9999) == 14
+    assert table(round(12 / RAW_TO_MA)) == pytest.approx(7.1, abs=0.01)
+
+
+@pytest.mark.parametrize(
+    "points",
+    [
+        [[4, 0], [8, 4.0], [12, 7.1], [20, 14]],
+        [[4, 0.5], [8, 3.9], [12, 7.1], [20, 14]],
+        [[4, 0], [8, 3.9], [12, 7.1], [20, 15]],
+        [[4, 0], [9, 4.2], [13, 7.5], [20, 14]],
+    ],
+    ids=["titik-tengah", "titik-pertama", "titik-terakhir", "dua-titik"],
+)
+def test_partial_update_matches_rebuild(points):
+    table = CalibrationTable(PH)
+    moved = {"type": "piecewise", "points": points}
+    rebuilt = table.update(moved)
+    assert 0 < rebuilt
+    assert table.table == CalibrationTable(moved).table
+    # Kalibrasi sama dipasang ulang: tidak ada yang dihitung ulang
+    assert table.update(moved) == 0
+
+
+def test_update_changes_type():
+    table = CalibrationTable(PH)
+    tss = {"type": "polynomial", "input": "raw", "coefficients": [-50, 0.2, 1e-5]}
+    assert table.update(tss) == ADC_SIZE
+    assert table.table == CalibrationTable(tss).table
+    assert table(1000) == pytest.approx(-50 + 200 + 10)
+
+
+def test_output_clamp():
+    clamped = dict(PH, output_min=1.0, output_max=10.0)
+    table = CalibrationTable(clamped)
+    assert min(table.table) == 1.0 and max(table.table) == 10.0
@@ -0,0 +1,104 @@
+import struct
+
+import pytest
+
+from calibration import ADC_SIZE, CalibrationTable
+from modbusampere import AnalogPlan, Modbusampere
+from spanplanner import ReadSpan
+
+DEVICE = {"name": "modbusampere", "type": "modbus"}
+
+
+def analog_span(channels):
+    span = ReadSpan("/dev/ttyUSB0", 1, 3, 0)
+    for channel in range(channels):
+        sensor = {
+            "name": f"ai{channel}",
+            "type": "4-20mA",
+            "channel": channel,
+            "conversion": {
+                "input_min": 4,
+                "input_max": 20,
+                "output_min": 0,
+                "output_max": 10 * (channel + 1),
+            },
+        }
+        span.add((0, channel), DEVICE, sensor, channel, 1)
+    return span
+
+
+def frame(registers):
+    count = len(registers)
+    return bytes([1, 3, 2 * count]) + struct.pack(f">{count}H", *registers)
+
+
+def per_sensor(span, registers):
+    """Hasil jalur per sensor (Modbusampere.decode) sebagai pembanding"""
+    driver = Modbusampere({"devices": []}, None)
+    return [
+        driver.decode(sensor, registers, offset)
+        for key, device, sensor, offset in span.entries
+    ]
+
+
+REGISTERS = [(800 + 311 * channel) % 4096 for channel in range(6)]
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_calibrated_channel_uses_table(use_numpy):
+    span = analog_span(6)
+    expected = per_sensor(span, REGISTERS)
+    table = CalibrationTable({"points": [[4, 0], [12, 7.1], [20, 14]]})
+    plan = AnalogPlan(span, {(0, 1): table}, use_numpy=use_numpy)
+    values = plan.values(plan(frame(REGISTERS)))
+    assert values[1] == table(REGISTERS[1])
+    assert values[0] == pytest.approx(expected[0])
+    assert values[2:] == pytest.approx(expected[2:])
+
+    # Kalibrasi dilepas: kembali ke konversi linear
+    plan.set_table((0, 1), None)
+    assert plan.values(plan(frame(REGISTERS))) == pytest.approx(expected)
+
+
+# Di bawah 4 mA, tepat 4/20 mA, di atas 20 mA dan raw di luar ADC 12 bit
+EDGE_REGISTERS = [0, 819, 2048, 4095, 4096, 65535] * 3
+
+
+@pytest.mark.parametrize("channels", [6, 16])
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_matches_per_sensor_decode(channels, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    span = analog_span(channels)
+    plan = AnalogPlan(span, use_numpy=use_numpy)
+    assert plan.numpy == use_numpy
+    for registers in (
+        [(800 + 311 * channel) % 4096 for channel in range(channels)],
+        EDGE_REGISTERS[:channels],
+    ):
+        expected = per_sensor(span, registers)
+        assert plan.values(plan(frame(registers))) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_clamped_to_output_range(use_numpy):
+    plan = AnalogPlan(analog_span(6), use_numpy=use_numpy)
+    values = plan.values(plan(frame(EDGE_REGISTERS[:6])))
+    # 0 -> 0 mA dijepit ke output_min; 4096 & 65535 ke output_max
+    assert values[0] == 0
+    assert values[4] == 50 and values[5] == 60
+
+
+def test_read_failure():
+    plan = AnalogPlan(analog_span(6))
+    assert plan.values(None) == [None] * 6
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_calibrated_raw_beyond_adc(use_numpy):
+    # Raw >= ADC_SIZE (modul error/overrange) memakai entri tabel terakhir
+    span = analog_span(6)
+    table = CalibrationTable({"points": [[4, 0], [12, 7.1], [20, 14]]})
+    plan = AnalogPlan(span, {(0, 4): table, (0, 5): table}, use_numpy=use_numpy)
+    values = plan.values(plan(frame(EDGE_REGISTERS[:6])))
+    assert values[4] == values[5] == table(ADC_SIZE - 1) == 14
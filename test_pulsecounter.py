@@ -0,0 +1,141 @@
+import random
+
+import pytest
+
+from pulsecounter import DRY_AFTER, PULSE_INTERVAL, PulseBank, PulseChannel
+from scheduler import PollJob
+
+
+def pulse_train(period, width, bounce=0.0):
+    """
+    Level sinyal (True = aktif) sebagai fungsi waktu untuk pulse periodik
+    selebar width, pulse pertama mulai di setengah periode. bounce > 0
+    menambah chatter kontak 1 ms di awal dan akhir tiap pulse selama
+    bounce detik.
+    """
+
+    def level(t):
+        phase = (t - period / 2) % period
+        if bounce and (phase < bounce or width <= phase < width + bounce):
+            return int(phase * 1000) % 2 == 0
+        return phase < width
+
+    return level
+
+
+def simulate(
+    channel, level, duration, interval, jitter=0.0, seed=1, bank=None, start=0.0
+):
+    """
+    Sampling sinyal seperti PulseBank: periode interval + telat acak, dari
+    detik start sampai duration. Jika bank diisi, periode mengikuti
+    bank.adapt() seperti di gateway.
+    """
+    rng = random.Random(seed)
+    t = start
+    while t < duration:
+        active = level(t)
+        channel.feed(not active if channel.active_low else active, t)
+        if bank is not None:
+            bank.polls += 1
+            bank.baseline_polls += bank.interval / bank.base_interval
+            bank.adapt(t)
+            interval = bank.interval
+        t += interval + rng.uniform(0.0, jitter)
+    return channel.count
+
+
+@pytest.mark.parametrize("jitter", [0.0, 0.01])
+@pytest.mark.parametrize("mm_per_pulse", [0.5, 0.2])
+def test_rain_max_intensity(mm_per_pulse, jitter):
+    # Tipping bucket pada intensitas maksimum sensor (8 mm/menit). Reed
+    # switch menutup ~60 ms per tip dengan chatter 5 ms di kedua sisi.
+    period = 60.0 / (8.0 / mm_per_pulse)
+    duration = 600.0
+    expected = int(duration / period - 0.5) + 1
+    channel = PulseChannel("rainfall", 0)
+    counted = simulate(
+        channel,
+        pulse_train(period, 0.06, bounce=0.005),
+        duration,
+        PULSE_INTERVAL,
+        jitter=jitter,
+    )
+    assert counted == expected
+
+
+def test_spike_ignored():
+    # Spike 5 ms tiap detik tidak boleh terhitung
+    channel = PulseChannel("rainfall", 0)
+    assert simulate(channel, pulse_train(1.0, 0.005), 600.0, PULSE_INTERVAL) == 0
+
+
+def test_anemometer_10hz():
+    # Anemometer 10 Hz duty 50% dengan min_width 20 ms
+    channel = PulseChannel("kecepatan_angin", 2)
+    counted = simulate(channel, pulse_train(0.1, 0.05), 60.0, 0.01, jitter=0.002)
+    assert counted == 600
+
+
+TIPS = pulse_train(1.5, 0.1, bounce=0.005)
+PER_10_MIN = int(600.0 / 1.5 - 0.5) + 1
+
+
+@pytest.mark.parametrize("jitter", [0.0, 0.01])
+@pytest.mark.parametrize(
+    "level, duration",
+    [
+        (TIPS, 1200.0),
+        (lambda t: TIPS(t) if t < 600.0 or t >= 1800.0 else False, 2400.0),
+    ],
+    ids=["hujan-terus", "hujan-kering-hujan"],
+)
+def test_adaptive_interval(level, duration, jitter):
+    # Reed switch menutup 100 ms, hujan 8 mm/menit (0.2 mm/pulse). Setelah
+    # kering 20 menit tip pertama juga tidak boleh hilang.
+    channel = PulseChannel("rainfall", 0)
+    bank = PulseBank(None, "sim", 1)
+    bank.add(channel, {"interval": PULSE_INTERVAL})
+    counted = simulate(
+        channel, level, duration, PULSE_INTERVAL, jitter=jitter, bank=bank
+    )
+    assert counted == 2 * PER_10_MIN
+    # Periode adaptif harus lebih jarang dari periode config
+    assert bank.polls < duration / PULSE_INTERVAL
+    assert channel.closure_width - channel.min_width - bank.interval > 0
+
+
+@pytest.mark.parametrize("jitter", [0.0, 0.01])
+def test_dry_restart_without_measurement(jitter):
+    # Restart saat kemarau: belum ada closure terukur, periode kering tetap
+    # dipakai setelah dry_after dan tip pertama tidak boleh hilang
+    channel = PulseChannel("rainfall", 0)
+    bank = PulseBank(None, "sim", 1)
+    bank.add(channel, {"interval": PULSE_INTERVAL})
+    dry = DRY_AFTER + 60.0
+    simulate(channel, lambda t: False, dry, PULSE_INTERVAL, jitter=jitter, bank=bank)
+    assert channel.count == 0
+    assert bank.interval == pytest.approx(channel.closure / 2)
+
+    level = lambda t: TIPS(t - dry)
+    counted = simulate(
+        channel, level, dry + 600.0, bank.interval, jitter=jitter, bank=bank, start=dry
+    )
+    assert counted == PER_10_MIN
+
+
+def test_wide_closure_beyond_max_gap():
+    # Closure 400 ms: periode kering tidak dibatasi max_gap default dan
+    # jarak poll yang dijamin job ikut melebar sesuai closure terukur
+    channel = PulseChannel("rainfall", 0)
+    bank = PulseBank(None, "sim", 1)
+    bank.add(channel, {"interval": PULSE_INTERVAL})
+    bank.job = PollJob(bank.name, "sim", bank.interval, 0, None, bank.max_gap)
+    wide = pulse_train(2.0, 0.4)
+    level = lambda t: t < 60.0 and wide(t)
+    duration = 60.0 + DRY_AFTER + 60.0
+    assert simulate(channel, level, duration, PULSE_INTERVAL, bank=bank) == 30
+    assert bank.interval > bank.max_gap
+    assert bank.job.interval == bank.interval
+    assert bank.interval <= bank.job.max_gap
+    assert bank.job.max_gap == pytest.approx(channel.closure_width - channel.min_width)
@@ -0,0 +1,163 @@
+import struct
+
+import pytest
+
+from registerdriver import DecodePlan, RegisterDriver
+from spanplanner import ReadSpan
+
+RS_RAD = {"name": "rs_rad", "type": "direct_rs485"}
+
+
+def register_span(sensors, start=1000, device=RS_RAD):
+    """Span dari (nama, register_type, skala, alamat)"""
+    span = ReadSpan("/dev/ttyUSB1", 1, 3, start)
+    for index, (name, register_type, scale, address) in enumerate(sensors):
+        sensor = {
+            "name": name,
+            "register_address": address,
+            "conversion": {"register_type": register_type, "scaling_factor": scale},
+        }
+        span.add((1, index), device, sensor, address, 2 if "32" in register_type else 1)
+    return span
+
+
+def frame(registers):
+    count = len(registers)
+    return bytes([1, 3, 2 * count]) + struct.pack(f">{count}H", *registers)
+
+
+def decode_sensor(sensor, registers, offset):
+    """
+    Decode satu sensor langsung dari list register (jalur per sensor):
+    nilai 32 bit = word tinggi di register pertama
+    """
+    conversion = sensor["conversion"]
+    register_type = conversion["register_type"]
+    if register_type.startswith("32bit"):
+        word = (registers[offset] << 16) | registers[offset + 1]
+        if register_type == "32bit_float":
+            raw = struct.unpack(">f", struct.pack(">I", word))[0]
+        elif register_type == "32bit_int":
+            raw = word - (1 << 32) if word & 0x80000000 else word
+        else:
+            raw = word
+    else:
+        raw = registers[offset]
+        if register_type == "16bit_int" and raw & 0x8000:
+            raw -= 1 << 16
+    return raw * conversion["scaling_factor"]
+
+
+def per_sensor(span, registers):
+    return {
+        key: decode_sensor(sensor, registers, offset)
+        for key, device, sensor, offset in span.entries
+    }
+
+
+RS_RAD_SENSORS = [
+    ("debit", "16bit_int", 0.001, 1002),
+    ("water_height", "16bit_int", 1, 1003),
+    ("Velocity", "16bit_int", 0.01, 1004),
+    ("water_volume", "32bit_int", 1, 1000),
+]
+
+
+def test_rs_rad_values():
+    span = register_span(RS_RAD_SENSORS)
+    plan = DecodePlan(span)
+    raw = plan(frame((1, 5, 1500, 2000, 120)))
+    assert dict(zip(plan.keys, plan.values(raw))) == {
+        (1, 0): 1.5,
+        (1, 1): 2000.0,
+        (1, 2): 1.2,
+        (1, 3): 65541.0,
+    }
+
+
+# Word tinggi dulu: 0x3FC0_0000 = 1.5, 0xFFFF_FFFE = -2, 0x0001_0005 = 65541
+WORD_ORDER = [0x3FC0, 0x0000, 0xFFFF, 0xFFFE, 0x0001, 0x0005, 0xFF38, 0xFF38]
+MIXED = [
+    ("float", "32bit_float", 1, 0),
+    ("int32", "32bit_int", 0.5, 2),
+    ("uint32", "32bit_uint", 1, 4),
+    ("int16", "16bit_int", 0.1, 6),
+    ("uint16", "16bit_uint", 1, 7),
+]
+
+
+@pytest.mark.parametrize(
+    "registers",
+    [
+        WORD_ORDER,
+        [0xC2F6, 0xE979, 0x8000, 0x0000, 0xFFFF, 0xFFFF, 0x7FFF, 0x8000],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+    ],
+)
+def test_matches_per_sensor_decode(registers):
+    span = register_span(MIXED, start=0)
+    plan = DecodePlan(span)
+    values = dict(zip(plan.keys, plan.values(plan(frame(registers)))))
+    expected = per_sensor(span, registers)
+    assert values == pytest.approx(expected)
+
+
+def test_word_order():
+    span = register_span(MIXED, start=0)
+    plan = DecodePlan(span)
+    values = plan.values(plan(frame(WORD_ORDER)))
+    assert values == pytest.approx([1.5, -1.0, 65541, -20.0, 65336])
+
+
+def test_gaps_and_overlap_match_per_sensor_decode():
+    # Register tak terpakai di tengah span jadi pad byte; sensor yang
+    # register-nya tumpang tindih memakai Struct per sensor
+    registers = [7, 0x4120, 0x0000, 9, 11, 0xFFFF]
+    for sensors in (
+        [
+            ("a", "16bit_uint", 1, 0),
+            ("b", "32bit_float", 1, 1),
+            ("c", "16bit_int", 1, 5),
+        ],
+        [
+            ("a", "32bit_uint", 1, 0),
+            ("b", "16bit_uint", 2, 1),
+            ("c", "32bit_int", 1, 4),
+        ],
+    ):
+        span = register_span(sensors, start=0)
+        plan = DecodePlan(span)
+        values = dict(zip(plan.keys, plan.values(plan(frame(registers)))))
+        assert values == pytest.approx(per_sensor(span, registers))
+
+
+def test_read_failure():
+    plan = DecodePlan(register_span(RS_RAD_SENSORS))
+    assert plan.values(None) == [None] * 4
+
+
+def test_hold_zero():
+    span = register_span(RS_RAD_SENSORS)
+    plan = RegisterDriver({}).compile(span)
+    assert plan.hold_zero
+    keys = plan.keys
+
+    # 0 sebelum pernah ada nilai bukan 0 tetap dilaporkan
+    first = dict(zip(keys, plan.values(plan(frame((0, 0, 0, 2000, 120))))))
+    assert first[(1, 0)] == 0 and first[(1, 1)] == 2000.0
+
+    # Nilai 0 setelahnya diganti nilai terakhir, sensor lain tetap ikut berubah
+    plan.values(plan(frame((1, 5, 1500, 2000, 120))))
+    held = dict(zip(keys, plan.values(plan(frame((0, 0, 0, 1800, 0))))))
+    assert held == {(1, 0): 1.5, (1, 1): 1800.0, (1, 2): 1.2, (1, 3): 65541.0}
+
+    # Baca gagal: nilai terakhir dipakai
+    assert dict(zip(keys, plan.values(None))) == held
+
+    # Device lain tanpa hold_zero: 0 dan baca gagal dilaporkan apa adanya
+    other = dict(RS_RAD, name="level_meter")
+    plain = RegisterDriver({}).compile(register_span(RS_RAD_SENSORS, device=other))
+    assert not plain.hold_zero
+    plain.values(plain(frame((1, 5, 1500, 2000, 120))))
+    assert plain.values(plain(frame((0, 0, 0, 0, 0)))) == [0, 0, 0, 0]
+    assert plain.values(None) == [None] * 4
@@ -0,0 +1,125 @@
+import pytest
+
+from virtualsensor import VirtualSensors
+
+CONFIG = {
+    "devices": [
+        {
+            "name": "modbusampere",
+            "type": "modbus",
+            "sensors": [{"name": "ph"}, {"name": "tds"}],
+        },
+        {
+            "name": "rs_rad",
+            "type": "direct_rs485",
+            "section_parameters": {"size1": 2600},
+            "sensors": [
+                {"name": "debit"},
+                {"name": "water_height"},
+                {"name": "Velocity"},
+            ],
+        },
+    ]
+}
+VIRTUAL = [
+    {"name": "volume", "expression": "prev + debit * dt", "unit": "m³"},
+    {
+        "name": "luas_basah",
+        "device": "rs_rad",
+        "expression": "size1 / 1000 * water_height / 1000",
+        "unit": "m²",
+    },
+    {
+        "name": "debit_hitung",
+        "expression": "luas_basah * Velocity if Velocity > 0 else 0",
+        "unit": "m³/s",
+    },
+    {
+        "name": "tds_koreksi",
+        "expression": "tds / (1 + 0.02 * (suhu - 25))",
+        "constants": {"suhu": 28},
+    },
+]
+
+
+def virtual_sensors(specs):
+    return VirtualSensors(dict(CONFIG, virtual_sensors=specs))
+
+
+def readings():
+    return {
+        (1, 0): (1.5, {}),
+        (1, 1): (800.0, {}),
+        (1, 2): (1.2, {}),
+        (0, 1): (1200.0, {}),
+    }
+
+
+def test_dependency_order():
+    names = [sensor.name for sensor in virtual_sensors(VIRTUAL).order]
+    assert names.index("luas_basah") < names.index("debit_hitung")
+
+
+def test_evaluate_and_missing_input():
+    virtual = virtual_sensors(VIRTUAL)
+    values = readings()
+    virtual.evaluate(values, 100.0)
+    virtual.evaluate(values, 110.0)
+    assert values[("virtual", "volume")][0] == 15.0
+    assert values[("virtual", "debit_hitung")][0] == pytest.approx(2.6 * 0.8 * 1.2)
+    assert values[("virtual", "tds_koreksi")][0] == pytest.approx(1200.0 / 1.06)
+
+    # Input error: sensor turunannya error, yang lain tetap dihitung
+    values[(1, 2)] = (None, {})
+    virtual.evaluate(values, 120.0)
+    assert values[("virtual", "debit_hitung")][0] is None
+    assert values[("virtual", "volume")][0] == 30.0
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "__import__('os')",
+        "debit.real",
+        "open('x')",
+        "[debit]",
+        "2 ** 999999",
+        "2 ** (2 ** 60)",
+        "(10 ** 64) ** 7",
+        "(debit ** 2 + 1) ** 64",
+        "tidak_ada + 1",
+        "'teks'",
+        "lambda: 0",
+        "sqrt",
+    ],
+)
+def test_rejected_expressions(expression):
+    with pytest.raises(ValueError):
+        virtual_sensors([{"name": "x", "expression": expression}])
+
+
+def test_cycle_rejected():
+    cyclic = [
+        {"name": "a", "expression": "b + 1"},
+        {"name": "b", "expression": "a + 1"},
+    ]
+    with pytest.raises(ValueError, match="saling bergantung"):
+        virtual_sensors(cyclic)
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "debit * 10 ** 64 * 10 ** 64 * 10 ** 64 * 10 ** 64 * 10 ** 64",
+        "9 ** 64 * 9 ** 64 * 9 ** 64 * 9 ** 64 * 9 ** 64 * 9 ** 64",
+        "exp(water_height)",
+        "debit / (Velocity - Velocity)",
+        "log(debit - debit)",
+    ],
+)
+def test_runtime_errors_become_missing(expression):
+    # Overflow / domain error saat evaluasi: sensor error, loop publish jalan terus
+    virtual = virtual_sensors([{"name": "x", "expression": expression}])
+    values = readings()
+    virtual.evaluate(values, 100.0)
+    assert values[("virtual", "x")][0] is None
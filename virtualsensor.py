@@ -0,0 +1,346 @@
+import ast
+import math
+from graphlib import CycleError, TopologicalSorter
+
+# Fungsi & konstanta yang boleh dipakai di ekspresi sensor virtual
+FUNCTIONS = {
+    "abs": abs,
+    "min": min,
+    "max": max,
+    "round": round,
+    "sqrt": math.sqrt,
+    "exp": math.exp,
+    "log": math.log,
+    "log10": math.log10,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "atan": math.atan,
+    "atan2": math.atan2,
+    "hypot": math.hypot,
+    "pow": math.pow,
+}
+CONSTANTS = {"pi": math.pi, "e": math.e}
+# dt: detik sejak evaluasi sukses sebelumnya, prev: nilai sebelumnya
+CYCLE_NAMES = ("dt", "prev")
+MAX_POWER = 64  # batas eksponen ** konstanta, cegah bilangan raksasa
+
+ALLOWED_NODES = (
+    ast.Expression,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.BoolOp,
+    ast.Compare,
+    ast.IfExp,
+    ast.Call,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.FloorDiv,
+    ast.Mod,
+    ast.Pow,
+    ast.UAdd,
+    ast.USub,
+    ast.Not,
+    ast.And,
+    ast.Or,
+    ast.Eq,
+    ast.NotEq,
+    ast.Lt,
+    ast.LtE,
+    ast.Gt,
+    ast.GtE,
+)
+
+NO_READING = (None, {})
+
+
+def parse_expression(name, expression):
+    """
+    Parse ekspresi jadi AST yang hanya berisi aritmatika, perbandingan,
+    if-else, nama variabel dan panggilan FUNCTIONS. Mengembalikan
+    (ast, nama variabel yang dipakai). ValueError jika ada yang lain.
+    """
+    if not isinstance(expression, str):
+        raise ValueError(f"virtual {name}: expression wajib berupa string")
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"virtual {name}: ekspresi tidak valid ({e.msg})")
+
+    variables = set()
+    callees = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise ValueError(
+                f"virtual {name}: {type(node).__name__} tidak diizinkan di ekspresi"
+            )
+        if isinstance(node, ast.Constant):
+            value = node.value
+            if not isinstance(value, (int, float)):
+                raise ValueError(f"virtual {name}: konstanta {value!r} bukan angka")
+        elif isinstance(node, ast.Call):
+            if (
+                not isinstance(node.func, ast.Name)
+                or node.func.id not in FUNCTIONS
+                or node.keywords
+            ):
+                raise ValueError(
+                    f"virtual {name}: hanya fungsi {', '.join(FUNCTIONS)} "
+                    f"yang boleh dipanggil"
+                )
+            callees.add(node.func)
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            # ** hanya dengan eksponen konstanta kecil; eksponen variabel
+            # lewat pow() (float, overflow jadi error bukan bilangan raksasa)
+            exponent = node.right
+            if isinstance(exponent, ast.UnaryOp) and isinstance(
+                exponent.op, (ast.USub, ast.UAdd)
+            ):
+                exponent = exponent.operand
+            if (
+                not isinstance(exponent, ast.Constant)
+                or abs(exponent.value) > MAX_POWER
+            ):
+                raise ValueError(
+                    f"virtual {name}: ** hanya untuk eksponen konstanta "
+                    f"maksimal {MAX_POWER}, pakai pow() untuk eksponen lain"
+                )
+            # (a ** 64) ** 7 = a ** 448: eksponen total tidak lagi dibatasi
+            if any(
+                isinstance(inner, ast.BinOp) and isinstance(inner.op, ast.Pow)
+                for inner in ast.walk(node.left)
+            ):
+                raise ValueError(
+                    f"virtual {name}: ** bertingkat tidak diizinkan, pakai pow()"
+                )
+        elif isinstance(node, ast.Name) and node not in callees:
+            if node.id in FUNCTIONS:
+                raise ValueError(f"virtual {name}: {node.id} hanya bisa dipanggil")
+            if node.id not in CONSTANTS:
+                variables.add(node.id)
+    return tree, variables
+
+
+class VirtualSensor:
+    """Satu sensor virtual hasil kompilasi: bytecode + pemetaan input"""
+
+    __slots__ = (
+        "name",
+        "key",
+        "expression",
+        "code",
+        "inputs",
+        "namespace",
+        "prev",
+        "last_time",
+    )
+
+    def __init__(self, name, expression, code, inputs, constants, initial):
+        self.name = name
+        self.key = ("virtual", name)
+        self.expression = expression
+        self.code = code
+        # (nama variabel, key readings) untuk input sensor fisik/virtual
+        self.inputs = inputs
+        # Namespace eval dibuat sekali; tiap siklus hanya input yang ditimpa
+        self.namespace = {"__builtins__": {}, **FUNCTIONS, **CONSTANTS, **constants}
+        self.prev = initial
+        self.last_time = None
+
+
+class VirtualSensors:
+    """
+    Sensor virtual dari config "virtual_sensors": nilai turunan yang
+    dihitung dari sensor lain tiap siklus publish, tanpa transaksi bus.
+
+      "virtual_sensors": [
+        {"name": "volume_kumulatif", "expression": "prev + debit * dt",
+         "unit": "m³", "initial": 0},
+        {"name": "luas_basah", "device": "rs_rad",
+         "expression": "size1 / 1000 * water_height / 1000", "unit": "m²"}
+      ]
+
+    Variabel yang bisa dipakai: nama sensor fisik (jika unik), sensor
+    virtual lain, dt, prev, "constants" milik sensor virtual itu, dan
+    section_parameters milik "device". Nama sensor yang dobel (mis. dua
+    RS-RAD) dipetakan lewat "inputs": {"debit2": "rs_rad_2/debit"}.
+    Ekspresi diparse & dikompilasi sekali saat config dimuat lalu
+    dievaluasi berurutan sesuai dependensinya.
+    """
+
+    def __init__(self, config):
+        physical = {}
+        qualified = {}
+        for d_idx, device in enumerate(config.get("devices", [])):
+            for s_idx, sensor in enumerate(device.get("sensors", [])):
+                key = (d_idx, s_idx)
+                qualified[f"{device.get('name')}/{sensor.get('name')}"] = key
+                # Nama dobel: None, harus lewat "inputs"
+                name = sensor.get("name")
+                physical[name] = None if name in physical else key
+        sections = {
+            device.get("name"): device.get("section_parameters") or {}
+            for device in config.get("devices", [])
+        }
+
+        specs = config.get("virtual_sensors", [])
+        if not isinstance(specs, list):
+            raise ValueError("virtual_sensors wajib berupa list")
+        virtual_names = set()
+        for spec in specs:
+            if not isinstance(spec, dict) or not isinstance(spec.get("name"), str):
+                raise ValueError("tiap virtual_sensors wajib object dengan name")
+            if spec["name"] in virtual_names or spec["name"] in physical:
+                raise ValueError(f"nama sensor virtual {spec['name']} sudah dipakai")
+            virtual_names.add(spec["name"])
+
+        compiled = {}
+        graph = {}
+        for spec in specs:
+            name = spec["name"]
+            tree, variables = parse_expression(name, spec.get("expression"))
+
+            constants = {}
+            if "device" in spec:
+                if spec["device"] not in sections:
+                    raise ValueError(
+                        f"virtual {name}: device {spec['device']} tidak ada"
+                    )
+                constants.update(sections[spec["device"]])
+            constants.update(spec.get("constants", {}))
+            for var, value in constants.items():
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    raise ValueError(f"virtual {name}: konstanta {var} bukan angka")
+            aliases = spec.get("inputs", {})
+            if not isinstance(aliases, dict):
+                raise ValueError(f"virtual {name}: inputs wajib berupa object")
+
+            inputs = []
+            depends = set()
+            for var in sorted(variables):
+                if var in CYCLE_NAMES or var in constants:
+                    continue
+                if var in aliases:
+                    source = aliases[var]
+                    if source in virtual_names:
+                        key = ("virtual", source)
+                        depends.add(source)
+                    elif source in qualified:
+                        key = qualified[source]
+                    else:
+                        raise ValueError(
+                            f"virtual {name}: input {var} -> {source} tidak ditemukan "
+                            f"(format device/sensor)"
+                        )
+                elif var in virtual_names:
+                    key = ("virtual", var)
+                    depends.add(var)
+                elif physical.get(var) is not None:
+                    key = physical[var]
+                elif var in physical:
+                    raise ValueError(
+                        f"virtual {name}: sensor {var} ada di lebih dari satu device, "
+                        f"petakan lewat inputs"
+                    )
+                else:
+                    raise ValueError(f"virtual {name}: variabel {var} tidak dikenal")
+                inputs.append((var, key))
+
+            initial = spec.get("initial", 0.0)
+            if not isinstance(initial, (int, float)) or isinstance(initial, bool):
+                raise ValueError(f"virtual {name}: initial wajib berupa angka")
+            code = compile(tree, f"<virtual {name}>", "eval")
+            compiled[name] = VirtualSensor(
+                name, spec["expression"], code, tuple(inputs), constants, initial
+            )
+            graph[name] = depends
+
+        try:
+            order = TopologicalSorter(graph).static_order()
+            self.order = tuple(compiled[name] for name in order)
+        except CycleError as e:
+            cycle = " -> ".join(e.args[1])
+            raise ValueError(f"sensor virtual saling bergantung: {cycle}")
+        self.specs = specs
+
+    def evaluate(self, readings, now):
+        """
+        Hitung semua sensor virtual dari readings (hasil PollScheduler) dan
+        simpan hasilnya di readings dengan key ("virtual", name). Input yang
+        error membuat sensor virtual itu error (None) di siklus ini.
+        """
+        for sensor in self.order:
+            namespace = sensor.namespace
+            for var, key in sensor.inputs:
+                value = readings.get(key, NO_READING)[0]
+                if value is None:
+                    readings[sensor.key] = NO_READING
+                    break
+                namespace[var] = value
+            else:
+                last_time = sensor.last_time
+                namespace["dt"] = 0.0 if last_time is None else now - last_time
+                namespace["prev"] = sensor.prev
+                try:
+                    value = eval(sensor.code, namespace)
+                    # math.isfinite pada int raksasa juga OverflowError
+                    if not isinstance(value, (int, float)) or not math.isfinite(value):
+                        value = None
+                except (ArithmeticError, OverflowError, ValueError, TypeError) as e:
+                    print(f"⚠️ Virtual {sensor.name}: {e}")
+                    value = None
+                readings[sensor.key] = (value, {})
+                if value is not None:
+                    sensor.prev = value
+                    sensor.last_time = now
+
+
+if __name__ == "__main__":
+    # Benchmark sensor virtual: python virtualsensor.py
+    # (cek kebenaran ada di test_virtualsensor.py)
+    import json
+    import time
+
+    with open("sensor_config_digital_input.json") as f:
+        config = json.load(f)
+    config["virtual_sensors"] = [
+        {"name": "volume", "expression": "prev + debit * dt", "unit": "m³"},
+        {
+            "name": "luas_basah",
+            "device": "rs_rad",
+            "expression": "size1 / 1000 * water_height / 1000",
+            "unit": "m²",
+        },
+        {
+            "name": "debit_hitung",
+            "expression": "luas_basah * Velocity if Velocity > 0 else 0",
+            "unit": "m³/s",
+        },
+        {
+            "name": "tds_koreksi",
+            "expression": "tds / (1 + 0.02 * (suhu - 25))",
+            "constants": {"suhu": 28},
+        },
+    ]
+    virtual = VirtualSensors(config)
+    readings = {
+        (1, 0): (1.5, {}),
+        (1, 1): (800.0, {}),
+        (1, 2): (1.2, {}),
+        (0, 1): (1200.0, {}),
+    }
+
+    N = 50000
+    started = time.perf_counter()
+    for i in range(N):
+        virtual.evaluate(readings, 200.0 + i)
+    elapsed = time.perf_counter() - started
+    print(
+        f"{len(virtual.order)} sensor virtual: "
+        f"{elapsed / N * 1e6:.2f} µs per siklus publish"
+    )